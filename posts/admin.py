@@ -1,7 +1,45 @@
 from django.contrib import admin
 
-from .models import Post, Comment
+from .models import (
+    Post,
+    Comment,
+    CommentDailyStats,
+    ModerationVerdict,
+    ScheduledAutoResponse,
+    Statuses,
+)
+from .tasks import requeue_failed
 
 
-admin.site.register(Post)
-admin.site.register(Comment)
+@admin.action(description="Requeue failed moderation")
+def requeue_failed_moderation(modeladmin, request, queryset):
+    ids = list(queryset.filter(status=Statuses.FAILED).values_list("id", flat=True))
+    requeued_ids = requeue_failed(queryset.model, ids)
+    modeladmin.message_user(request, f"{len(requeued_ids)} requeued for moderation.")
+
+
+class ModeratedAdmin(admin.ModelAdmin):
+    """
+    Admin of moderated objects, showing moderation failures.
+    """
+
+    list_display = ["__str__", "status", "moderation_attempts", "updated_at"]
+    list_filter = ["status"]
+    readonly_fields = ["moderation_attempts", "moderation_error"]
+    actions = [requeue_failed_moderation]
+
+
+admin.site.register(Post, ModeratedAdmin)
+admin.site.register(Comment, ModeratedAdmin)
+admin.site.register(CommentDailyStats)
+admin.site.register(ScheduledAutoResponse)
+
+
+@admin.register(ModerationVerdict)
+class ModerationVerdictAdmin(admin.ModelAdmin):
+    """
+    Admin of the AI model verdicts the local classifier is trained on.
+    """
+
+    list_display = ["content_hash", "is_acceptable", "prompt_version", "created_at"]
+    list_filter = ["is_acceptable", "prompt_version"]
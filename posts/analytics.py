@@ -0,0 +1,131 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Comment, CommentDailyStats, Statuses
+
+
+STATUS_FIELDS = {
+    Statuses.PENDING: "pending_comments",
+    Statuses.APPROVED: "approved_comments",
+    Statuses.BLOCKED: "blocked_comments",
+    Statuses.FAILED: "failed_comments",
+}
+
+
+def get_stats_date(created_at):
+    """
+    Return the day a comment is counted on.
+    """
+
+    return timezone.localdate(created_at)
+
+
+def apply_deltas(deltas):
+    """
+    Apply per-day counter deltas to the rollup table.
+    """
+
+    with transaction.atomic():
+        for date, counters in sorted(deltas.items()):
+            changes = {
+                field: F(field) + delta for field, delta in counters.items() if delta
+            }
+            if not changes:
+                continue
+            CommentDailyStats.objects.get_or_create(date=date)
+            CommentDailyStats.objects.filter(date=date).update(**changes)
+
+
+def record_comments_created(comments):
+    """
+    Count newly created comments in the rollup table.
+    """
+
+    deltas = defaultdict(Counter)
+    for comment in comments:
+        counters = deltas[get_stats_date(comment.created_at)]
+        counters["total_comments"] += 1
+        counters[STATUS_FIELDS[comment.status]] += 1
+    apply_deltas(deltas)
+
+
+def record_comments_deleted(comments):
+    """
+    Remove deleted comments from the rollup table.
+    """
+
+    deltas = defaultdict(Counter)
+    for comment in comments:
+        counters = deltas[get_stats_date(comment.created_at)]
+        counters["total_comments"] -= 1
+        counters[STATUS_FIELDS[comment.status]] -= 1
+    apply_deltas(deltas)
+
+
+def record_status_changes(changes):
+    """
+    Move comments between status counters of the rollup table.
+
+    Takes (created_at, old_status, new_status) tuples.
+    """
+
+    deltas = defaultdict(Counter)
+    for created_at, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        counters = deltas[get_stats_date(created_at)]
+        counters[STATUS_FIELDS[old_status]] -= 1
+        counters[STATUS_FIELDS[new_status]] += 1
+    apply_deltas(deltas)
+
+
+def get_day_range(date_from, date_to):
+    """
+    Return the half-open [start, end) timestamp range covering the days.
+    """
+
+    start = timezone.make_aware(datetime.combine(date_from, time.min))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return start, end
+
+
+def rebuild_comment_daily_stats(date_from=None, date_to=None):
+    """
+    Rebuild the rollup table from the comments table, optionally only for
+    the days between date_from and date_to inclusive.
+
+    Returns the number of days with comments.
+    """
+
+    comments = Comment.objects.all()
+    stats_days = CommentDailyStats.objects.all()
+    if date_from is not None and date_to is not None:
+        # A half-open timestamp range keeps the created_at index usable.
+        start, end = get_day_range(date_from, date_to)
+        comments = comments.filter(created_at__gte=start, created_at__lt=end)
+        stats_days = stats_days.filter(date__gte=date_from, date__lte=date_to)
+
+    rows = (
+        comments.annotate(date=TruncDate("created_at"))
+        .values("date", "status")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+    stats = {}
+    for row in rows:
+        day = stats.setdefault(row["date"], CommentDailyStats(date=row["date"]))
+        day.total_comments += row["count"]
+        field = STATUS_FIELDS[row["status"]]
+        setattr(day, field, getattr(day, field) + row["count"])
+
+    with transaction.atomic():
+        stats_days.delete()
+        CommentDailyStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+    return len(stats)
@@ -0,0 +1,538 @@
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from itertools import groupby
+from unittest.mock import MagicMock, patch
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    OperationalError,
+    connection,
+    connections,
+    transaction,
+)
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .analytics import rebuild_comment_daily_stats
+from .models import Post, Comment, Statuses
+from .renderers import ORJSONRenderer
+from .serializers import PostSerializer, ValuesSerializer
+
+
+SEED_BATCH_SIZE = 5000
+
+STRESS_ALIAS = "sqlite_stress"
+STRESS_ROWS = 100
+
+# Metrics compared against a baseline, and whether a higher value is better.
+COMPARED_METRICS = {
+    ("latency_ms", "p50"): False,
+    ("latency_ms", "p95"): False,
+    ("latency_ms", "p99"): False,
+    ("throughput_rps",): True,
+    ("queries_per_request", "mean"): False,
+}
+
+
+def seed_dataset(posts, comments, days=30, authors=10):
+    """
+    Create approved posts and comments spread over the last days with
+    bulk_create, then build the daily comment stats from them.
+
+    Every tenth comment is blocked. Returns the created posts.
+    """
+
+    User = get_user_model()
+    users = [
+        User(username=f"benchmark{i}", email=f"benchmark{i}@example.com")
+        for i in range(authors)
+    ]
+    for user in users:
+        user.set_unusable_password()
+    users = User.objects.bulk_create(users)
+
+    now = timezone.now()
+    with transaction.atomic():
+        created_posts = Post.objects.bulk_create(
+            [
+                Post(
+                    author=users[i % authors],
+                    title=f"Benchmark post {i}",
+                    content=f"Content of benchmark post {i}.",
+                    status=Statuses.APPROVED,
+                )
+                for i in range(posts)
+            ],
+            batch_size=SEED_BATCH_SIZE,
+        )
+
+        for start in range(0, comments, SEED_BATCH_SIZE):
+            indexes = range(start, min(start + SEED_BATCH_SIZE, comments))
+            batch = Comment.objects.bulk_create(
+                [
+                    Comment(
+                        post=created_posts[i % posts],
+                        author=users[i % authors],
+                        content=f"Benchmark comment {i}.",
+                        status=(Statuses.BLOCKED if i % 10 == 0 else Statuses.APPROVED),
+                    )
+                    for i in indexes
+                ]
+            )
+            # bulk_create sets auto_now_add fields to now, spread them after.
+            for day, group in groupby(
+                zip(indexes, batch), key=lambda pair: days * pair[0] // comments
+            ):
+                group = [comment.id for _, comment in group]
+                Comment.objects.filter(id__gte=group[0], id__lte=group[-1]).update(
+                    created_at=now - timedelta(days=day)
+                )
+
+    rebuild_comment_daily_stats()
+    return created_posts
+
+
+@contextmanager
+def stub_groq():
+    """
+    Replace the GROQ clients with stubs approving everything, so that a
+    benchmark never calls the real API.
+    """
+
+    completion = MagicMock()
+    completion.choices[0].message.content = "1"
+    async_client = MagicMock()
+
+    async def create(*args, **kwargs):
+        return completion
+
+    async_client.chat.completions.create = create
+    with patch("posts.utils.client") as client, patch(
+        "posts.utils.get_async_client", return_value=async_client
+    ):
+        client.chat.completions.create.return_value = completion
+        yield
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the benchmark against a fresh test database, never the real one.
+
+    SQLite uses a temporary file rather than memory, so that every client
+    thread has its own connection like in production.
+    """
+
+    test_settings = connection.settings_dict["TEST"]
+    directory = None
+    if connection.vendor == "sqlite" and not test_settings["NAME"]:
+        directory = tempfile.mkdtemp(prefix="benchmark-")
+        test_settings["NAME"] = os.path.join(directory, "db.sqlite3")
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if directory is not None:
+            test_settings["NAME"] = None
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def summarize(latencies, query_counts, errors, duration):
+    """
+    Return throughput, latency percentiles and queries per request.
+    """
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    if len(latencies_ms) > 1:
+        cut_points = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+        p50, p95, p99 = cut_points[49], cut_points[94], cut_points[98]
+    else:
+        p50 = p95 = p99 = latencies_ms[0] if latencies_ms else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies_ms), 3) if latencies_ms else 0.0,
+            "p50": round(p50, 3),
+            "p95": round(p95, 3),
+            "p99": round(p99, 3),
+            "max": round(latencies_ms[-1], 3) if latencies_ms else 0.0,
+        },
+        "queries_per_request": {
+            "mean": round(statistics.fmean(query_counts), 2) if query_counts else 0.0,
+            "max": max(query_counts, default=0),
+        },
+    }
+
+
+def run_client(url, requests, headers):
+    """
+    Send requests to the url one after the other, as one client would.
+
+    Returns the latency, the number of queries and the status of each.
+    """
+
+    client = Client()
+    results = []
+    try:
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url, **headers)
+                latency = time.perf_counter() - start
+            results.append((latency, len(queries), response.status_code))
+    finally:
+        connection.close()
+    return results
+
+
+def benchmark_endpoint(url, requests, concurrency, warmup=0, headers=None):
+    """
+    Drive an endpoint with concurrent clients and summarize the results.
+    """
+
+    headers = headers or {}
+    run_client(url, warmup, headers)
+
+    shares = [requests // concurrency] * concurrency
+    for i in range(requests % concurrency):
+        shares[i] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(run_client, url, share, headers)
+            for share in shares
+            if share
+        ]
+        results = [result for future in futures for result in future.result()]
+    duration = time.perf_counter() - start
+
+    return summarize(
+        [latency for latency, _, _ in results],
+        [query_count for _, query_count, _ in results],
+        sum(1 for _, _, status_code in results if status_code >= 400),
+        duration,
+    )
+
+
+def get_endpoints(posts, days):
+    """
+    Return the url of each benchmarked endpoint.
+    """
+
+    today = timezone.localdate()
+    date_from = today - timedelta(days=days - 1)
+    breakdown_url = reverse("comments_daily_breakdown")
+    return {
+        "posts_list": reverse("post_list_create"),
+        "post_detail": reverse("post_detail", kwargs={"pk": posts[0].id}),
+        "comments_list": reverse(
+            "comment_list_create", kwargs={"post_id": posts[0].id}
+        ),
+        "comments_daily_breakdown": (
+            f"{breakdown_url}?date_from={date_from.isoformat()}"
+            f"&date_to={today.isoformat()}"
+        ),
+    }
+
+
+def benchmark_serialization(page_size=100, repeat=20):
+    """
+    Measure the CPU time per listed post of fetching, serializing and
+    rendering a page with the ModelSerializer and with the values() path.
+    """
+
+    queryset = Post.objects.order_by("-created_at", "-id")
+    values_serializer = ValuesSerializer(PostSerializer)
+
+    def serialize_models():
+        posts = queryset.select_related("author")[:page_size]
+        return JSONRenderer().render(PostSerializer(posts, many=True).data)
+
+    def serialize_values():
+        rows = values_serializer.get_values(queryset)[:page_size]
+        return ORJSONRenderer().render(values_serializer.to_representation(rows))
+
+    items = queryset[:page_size].count()
+    results = {"items": items}
+    for name, serialize in (
+        ("model_serializer", serialize_models),
+        ("values_serializer", serialize_values),
+    ):
+        serialize()
+        start = time.process_time()
+        for _ in range(repeat):
+            serialize()
+        duration = time.process_time() - start
+        results[f"{name}_us_per_item"] = (
+            round(duration / (repeat * items) * 1e6, 2) if items else 0.0
+        )
+
+    fast = results["values_serializer_us_per_item"]
+    results["speedup"] = (
+        round(results["model_serializer_us_per_item"] / fast, 2) if fast else 0.0
+    )
+    return results
+
+
+@contextmanager
+def stress_database(options):
+    """
+    Register a connection alias to a scratch SQLite file configured with the
+    OPTIONS, with a table of items to update and a table of events to insert.
+    """
+
+    directory = tempfile.mkdtemp(prefix="sqlite-stress-")
+    connections.settings[STRESS_ALIAS] = connections.configure_settings(
+        {
+            DEFAULT_DB_ALIAS: {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(directory, "stress.sqlite3"),
+                "OPTIONS": options,
+            }
+        }
+    )[DEFAULT_DB_ALIAS]
+    try:
+        with connections[STRESS_ALIAS].cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE item (id INTEGER PRIMARY KEY, status TEXT, "
+                "attempts INTEGER)"
+            )
+            cursor.execute(
+                "CREATE TABLE event (id INTEGER PRIMARY KEY, item_id INTEGER, "
+                "status TEXT)"
+            )
+            cursor.executemany(
+                "INSERT INTO item (id, status, attempts) VALUES (%s, 'pending', 0)",
+                [(i,) for i in range(STRESS_ROWS)],
+            )
+        connections[STRESS_ALIAS].close()
+        yield
+    finally:
+        connections[STRESS_ALIAS].close()
+        del connections[STRESS_ALIAS]
+        del connections.settings[STRESS_ALIAS]
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_writer(index, transactions, barrier):
+    """
+    Run write transactions shaped like moderation status transitions: read
+    an item, update it and record an event.
+
+    Returns the number of committed transactions and of lock errors.
+    """
+
+    committed = lock_errors = 0
+    barrier.wait()
+    try:
+        for i in range(transactions):
+            item_id = (index * transactions + i) % STRESS_ROWS
+            try:
+                with transaction.atomic(using=STRESS_ALIAS):
+                    with connections[STRESS_ALIAS].cursor() as cursor:
+                        cursor.execute(
+                            "SELECT status FROM item WHERE id = %s", [item_id]
+                        )
+                        status = "approved" if cursor.fetchone()[0] else "blocked"
+                        cursor.execute(
+                            "UPDATE item SET status = %s, attempts = attempts + 1 "
+                            "WHERE id = %s",
+                            [status, item_id],
+                        )
+                        cursor.execute(
+                            "INSERT INTO event (item_id, status) VALUES (%s, %s)",
+                            [item_id, status],
+                        )
+                committed += 1
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                lock_errors += 1
+    finally:
+        connections[STRESS_ALIAS].close()
+    return committed, lock_errors
+
+
+def stress_sqlite(options, threads=16, transactions=200):
+    """
+    Run concurrent writer threads, each with its own connection, against a
+    scratch SQLite file configured with the OPTIONS.
+
+    Returns the committed transactions, the "database is locked" errors and
+    the write throughput.
+    """
+
+    barrier = threading.Barrier(threads)
+    with stress_database(options):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(
+                executor.map(
+                    run_writer,
+                    range(threads),
+                    [transactions] * threads,
+                    [barrier] * threads,
+                )
+            )
+        duration = time.perf_counter() - start
+
+    committed = sum(result[0] for result in results)
+    return {
+        "threads": threads,
+        "transactions": threads * transactions,
+        "committed": committed,
+        "lock_errors": sum(result[1] for result in results),
+        "duration_s": round(duration, 3),
+        "commits_per_second": round(committed / duration, 1) if duration else 0.0,
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    posts=1000,
+    comments=10000,
+    days=30,
+    requests=200,
+    concurrency=8,
+    warmup=10,
+    response_cache=False,
+):
+    """
+    Seed a test database, drive every endpoint and return the results.
+
+    The response cache is disabled unless response_cache is set, so that
+    the results measure the database path. Reads aren't routed to replicas.
+    """
+
+    # Only the default database is swapped for the seeded test database, so
+    # reads must not go to replica aliases pointing at the real ones.
+    overrides = {
+        "ALLOWED_HOSTS": ["testserver"],
+        "DATABASE_READ_REPLICAS": [],
+        # The benchmark runs in one process, where a local cache is coherent.
+        "RESPONSE_CACHE_ENABLED": response_cache,
+    }
+    if not response_cache:
+        overrides["CACHES"] = {
+            "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+            "moderation": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "benchmark-moderation",
+            },
+        }
+
+    with ExitStack() as stack:
+        stack.enter_context(override_settings(**overrides))
+        stack.enter_context(stub_groq())
+        stack.enter_context(benchmark_database())
+
+        seed_start = time.perf_counter()
+        created_posts = seed_dataset(posts, comments, days)
+        seed_duration = time.perf_counter() - seed_start
+
+        token = RefreshToken.for_user(created_posts[0].author).access_token
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+        endpoints = {}
+        for name, url in get_endpoints(created_posts, days).items():
+            endpoints[name] = {
+                "url": url,
+                **benchmark_endpoint(url, requests, concurrency, warmup, headers),
+            }
+        serialization = benchmark_serialization()
+
+    return {
+        "meta": {
+            "git_commit": get_git_commit(),
+            "timestamp": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "posts": posts,
+            "comments": comments,
+            "days": days,
+            "requests": requests,
+            "concurrency": concurrency,
+            "response_cache": response_cache,
+            "seed_seconds": round(seed_duration, 2),
+        },
+        "endpoints": endpoints,
+        "serialization": serialization,
+    }
+
+
+def get_metric(result, path):
+    for key in path:
+        result = result[key]
+    return result
+
+
+def compare_results(baseline, current, max_regression=None):
+    """
+    Compare the endpoints of two benchmark results.
+
+    Returns the change of every compared metric, in percent, and the list of
+    metrics that got worse by more than max_regression percent.
+    """
+
+    changes = {}
+    regressions = []
+    for name, result in current["endpoints"].items():
+        if name not in baseline["endpoints"]:
+            continue
+        changes[name] = {}
+        for path, higher_is_better in COMPARED_METRICS.items():
+            before = get_metric(baseline["endpoints"][name], path)
+            after = get_metric(result, path)
+            change = (after - before) / before * 100 if before else 0.0
+            metric = ".".join(path)
+            changes[name][metric] = {
+                "baseline": before,
+                "current": after,
+                "change_pct": round(change, 1),
+            }
+            worsening = -change if higher_is_better else change
+            if max_regression is not None and worsening > max_regression:
+                regressions.append(f"{name} {metric}")
+    return changes, regressions
+
+
+def dump_results(results, path):
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+        output.write("\n")
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+
+class BulkCreateView(generics.GenericAPIView):
+    """
+    View creating a list of objects in one request.
+
+    Every item is validated by the serializer_class. The valid ones are
+    inserted with one bulk_create in a single transaction, and the invalid
+    ones are reported by their index in the request, so that an importer can
+    fix and resend only those. Views build the unsaved objects and hand the
+    created ones to moderation.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def build_object(self, validated_data):
+        raise NotImplementedError
+
+    def perform_bulk_create(self, objects):
+        raise NotImplementedError
+
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Expected a non-empty list of items.")
+        if len(items) > settings.BULK_CREATE_MAX_ITEMS:
+            raise ValidationError(
+                f"At most {settings.BULK_CREATE_MAX_ITEMS} items can be created "
+                "in one request."
+            )
+        return items
+
+    def post(self, request, *args, **kwargs):
+        objects, errors = [], []
+        for index, item in enumerate(self.get_items(request)):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                objects.append(self.build_object(serializer.validated_data))
+            else:
+                errors.append({"index": index, "errors": serializer.errors})
+
+        if objects:
+            with transaction.atomic():
+                objects = self.perform_bulk_create(objects)
+
+        created = self.get_serializer(objects, many=True).data if objects else []
+        return Response(
+            {"created": created, "errors": errors},
+            status=status.HTTP_201_CREATED if objects else status.HTTP_400_BAD_REQUEST,
+        )
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .verdict_cache import is_shared_cache
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    """
+    Reject the response cache on a per-process default cache, where the
+    invalidations made by other processes are never seen.
+    """
+
+    if settings.RESPONSE_CACHE_ENABLED and not is_shared_cache("default"):
+        return [
+            Error(
+                "RESPONSE_CACHE_ENABLED requires a default cache shared by all "
+                "processes.",
+                hint="Set CACHE_REDIS_URL, or disable the response cache.",
+                id="posts.E001",
+            )
+        ]
+    return []
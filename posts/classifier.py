@@ -0,0 +1,430 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+from django.conf import settings
+
+from .models import ModerationVerdict
+from .prefilter import get_mtime, BLOCK, APPROVE, UNDECIDED
+from .verdict_cache import (
+    PROMPT_VERSION,
+    content_hash,
+    normalize_content,
+    increment_shared_counter,
+    get_counter_stats,
+)
+
+
+DEFAULT_FEATURES = 2**18
+
+# Verdicts whose features are held in memory at a time while training.
+TRAINING_CHUNK_SIZE = 2000
+
+WORD_RE = re.compile(r"\w+")
+
+STATS = {
+    BLOCK: "classifier_blocked",
+    APPROVE: "classifier_approved",
+    UNDECIDED: "classifier_undecided",
+}
+STATS_KEYS = tuple(STATS.values())
+
+
+def extract_features(content, n_features=DEFAULT_FEATURES):
+    """
+    Hash the word unigrams, word bigrams and character trigrams of the
+    normalized content into a sparse, L2-normalized feature vector.
+
+    Character trigrams make misspelled or obfuscated words share features
+    with the original word.
+    """
+
+    words = WORD_RE.findall(normalize_content(content))
+    grams = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        grams.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+
+    counts = {}
+    for gram in grams:
+        index = zlib.crc32(gram.encode("utf-8")) % n_features
+        counts[index] = counts.get(index, 0) + 1
+
+    norm = math.sqrt(sum(count * count for count in counts.values()))
+    return {index: count / norm for index, count in counts.items()}
+
+
+def sigmoid(score):
+    if score >= 0:
+        return 1 / (1 + math.exp(-score))
+    exp = math.exp(score)
+    return exp / (1 + exp)
+
+
+def get_class_weights(positives, negatives):
+    """
+    Return the weights giving both classes the same total weight, so that
+    the few blocked samples are not drowned out by the approved ones.
+    """
+
+    total = positives + negatives
+    return {
+        True: total / (2 * positives) if positives else 0.0,
+        False: total / (2 * negatives) if negatives else 0.0,
+    }
+
+
+class LogisticRegression:
+    """
+    Logistic regression over sparse hashed features, trained with SGD.
+
+    Predicts the probability that content is acceptable.
+    """
+
+    def __init__(self, n_features=DEFAULT_FEATURES, weights=None, bias=0.0):
+        self.n_features = n_features
+        self.weights = weights or {}
+        self.bias = bias
+
+    def predict_proba(self, features):
+        weights = self.weights
+        score = self.bias + sum(
+            weights.get(index, 0.0) * value for index, value in features.items()
+        )
+        return sigmoid(score)
+
+    def partial_fit(self, samples, labels, class_weights, rate, l2=1e-6, rng=random):
+        """
+        Make one SGD pass, in random order, over a chunk of feature vectors
+        and boolean labels, weighing each label by its class weight.
+        """
+
+        order = list(range(len(samples)))
+        rng.shuffle(order)
+        weights = self.weights
+        for i in order:
+            features = samples[i]
+            error = labels[i] - self.predict_proba(features)
+            step = rate * error * class_weights[labels[i]]
+            for index, value in features.items():
+                weight = weights.get(index, 0.0)
+                weights[index] = weight + step * value - rate * l2 * weight
+            self.bias += step
+        return self
+
+    def fit(self, samples, labels, epochs=5, learning_rate=0.5, l2=1e-6, seed=0):
+        """
+        Fit the model to feature vectors and boolean labels.
+        """
+
+        positives = sum(labels)
+        class_weights = get_class_weights(positives, len(labels) - positives)
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            self.partial_fit(
+                samples, labels, class_weights, learning_rate / (1 + epoch), l2, rng
+            )
+        return self
+
+    def to_dict(self):
+        return {
+            "n_features": self.n_features,
+            "bias": self.bias,
+            # Weights too small to change a verdict are not worth storing.
+            "weights": {
+                str(index): round(weight, 6)
+                for index, weight in self.weights.items()
+                if abs(weight) >= 1e-5
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            n_features=data["n_features"],
+            weights={int(index): weight for index, weight in data["weights"].items()},
+            bias=data["bias"],
+        )
+
+
+def get_decision(probability, threshold):
+    """
+    Return BLOCK or APPROVE if the probability is confident enough, otherwise
+    UNDECIDED.
+    """
+
+    if probability >= threshold:
+        return APPROVE
+    if probability <= 1 - threshold:
+        return BLOCK
+    return UNDECIDED
+
+
+def is_holdout(digest, holdout_percent):
+    """
+    Assign content to the held-out set by its hash, so that the split is
+    stable across retrains.
+    """
+
+    return int(digest[:8], 16) % 100 < holdout_percent
+
+
+def evaluate(model, labeled_samples, threshold):
+    """
+    Compare the model with the AI model verdicts it was not trained on, given
+    as (features, label) pairs.
+
+    Agreement is measured on the confident predictions only, since the
+    others are sent to the AI model anyway.
+    """
+
+    confusion = dict.fromkeys(
+        ("approved_ok", "approved_wrong", "blocked_ok", "blocked_wrong"), 0
+    )
+    samples = 0
+    correct = 0
+    for features, label in labeled_samples:
+        samples += 1
+        probability = model.predict_proba(features)
+        correct += (probability >= 0.5) == label
+        decision = get_decision(probability, threshold)
+        if decision == APPROVE:
+            confusion["approved_ok" if label else "approved_wrong"] += 1
+        elif decision == BLOCK:
+            confusion["blocked_wrong" if label else "blocked_ok"] += 1
+
+    confident = sum(confusion.values())
+    agreeing = confusion["approved_ok"] + confusion["blocked_ok"]
+    return {
+        "samples": samples,
+        "accuracy": correct / samples if samples else 0.0,
+        "threshold": threshold,
+        "coverage": confident / samples if samples else 0.0,
+        "agreement": agreeing / confident if confident else 0.0,
+        **confusion,
+    }
+
+
+def iter_chunks(items, size):
+    """
+    Yield lists of up to size consecutive items.
+    """
+
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class StreamedVerdicts:
+    """
+    Re-iterable verdict rows of a queryset, fetched in chunks with a
+    server-side cursor on every pass instead of cached like the rows of the
+    queryset itself.
+    """
+
+    def __init__(self, queryset, chunk_size=TRAINING_CHUNK_SIZE):
+        self.queryset = queryset
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self.queryset.iterator(chunk_size=self.chunk_size)
+
+
+def train(
+    verdicts,
+    holdout_percent=20,
+    threshold=0.97,
+    epochs=5,
+    chunk_size=TRAINING_CHUNK_SIZE,
+    learning_rate=0.5,
+    seed=0,
+):
+    """
+    Train a model on (content_hash, content, is_acceptable) verdicts and
+    evaluate it on the held-out ones.
+
+    The verdicts are iterated once per epoch, plus once to count the classes
+    and once to evaluate, and only chunk_size of them have their features in
+    memory at a time, so they can be streamed from the database. SGD shuffles
+    the verdicts within each chunk.
+
+    Returns the model and the evaluation report.
+    """
+
+    positives = negatives = 0
+    for digest, _, is_acceptable in verdicts:
+        if not is_holdout(digest, holdout_percent):
+            positives += is_acceptable
+            negatives += not is_acceptable
+    class_weights = get_class_weights(positives, negatives)
+
+    model = LogisticRegression()
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        training_verdicts = (
+            (content, is_acceptable)
+            for digest, content, is_acceptable in verdicts
+            if not is_holdout(digest, holdout_percent)
+        )
+        for chunk in iter_chunks(training_verdicts, chunk_size):
+            model.partial_fit(
+                [extract_features(content) for content, _ in chunk],
+                [is_acceptable for _, is_acceptable in chunk],
+                class_weights,
+                learning_rate / (1 + epoch),
+                rng=rng,
+            )
+
+    report = evaluate(
+        model,
+        (
+            (extract_features(content), is_acceptable)
+            for digest, content, is_acceptable in verdicts
+            if is_holdout(digest, holdout_percent)
+        ),
+        threshold,
+    )
+    report["training_samples"] = positives + negatives
+    return model, report
+
+
+def record_verdicts(verdicts):
+    """
+    Store verdicts of the AI model, given as (content, is_acceptable) pairs,
+    as training data for the classifier.
+    """
+
+    records = {}
+    for content, is_acceptable in verdicts:
+        digest = content_hash(content)
+        records[digest] = ModerationVerdict(
+            content_hash=digest,
+            content=content,
+            is_acceptable=is_acceptable,
+            prompt_version=PROMPT_VERSION,
+        )
+    ModerationVerdict.objects.bulk_create(records.values(), ignore_conflicts=True)
+
+
+def save_model(model, path):
+    """
+    Write the model file, atomically so that workers never load half of it.
+    """
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as output:
+        json.dump(model.to_dict(), output)
+    os.replace(temporary_path, path)
+
+
+class LocalClassifier:
+    """
+    Local classifier deciding content it is confident about before the AI
+    model.
+
+    The model trained by the train_moderation_classifier command is loaded
+    from MODERATION_CLASSIFIER_PATH and reloaded when the file changes. Without
+    a model file everything is left undecided. A fraction of confident
+    decisions, MODERATION_CLASSIFIER_AUDIT_RATE, is still sent to the AI model
+    so that fresh verdicts keep flowing in for the next retrain.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._checked_at = 0
+        self._stats = dict.fromkeys(STATS_KEYS, 0)
+
+    def _load(self):
+        path = settings.MODERATION_CLASSIFIER_PATH
+        model = None
+        mtime = get_mtime(path)
+        if mtime is not None:
+            with open(path, encoding="utf-8") as model_file:
+                model = LogisticRegression.from_dict(json.load(model_file))
+        return {"mtime": mtime, "model": model}
+
+    def _get_state(self):
+        now = time.monotonic()
+        state = self._state
+        if (
+            state is not None
+            and now - self._checked_at < settings.MODERATION_CLASSIFIER_RELOAD_INTERVAL
+        ):
+            return state
+
+        with self._lock:
+            self._checked_at = now
+            mtime = get_mtime(settings.MODERATION_CLASSIFIER_PATH)
+            if self._state is None or self._state["mtime"] != mtime:
+                self._state = self._load()
+            return self._state
+
+    def reload(self):
+        """
+        Reload the model from its file.
+        """
+
+        with self._lock:
+            self._state = self._load()
+            self._checked_at = time.monotonic()
+
+    def check(self, content):
+        """
+        Return BLOCK, APPROVE or UNDECIDED for the content.
+        """
+
+        model = self._get_state()["model"]
+        if model is None:
+            return UNDECIDED
+
+        probability = model.predict_proba(extract_features(content, model.n_features))
+        decision = get_decision(probability, settings.MODERATION_CLASSIFIER_THRESHOLD)
+        if (
+            decision != UNDECIDED
+            and random.random() < settings.MODERATION_CLASSIFIER_AUDIT_RATE
+        ):
+            decision = UNDECIDED
+
+        self._record(STATS[decision])
+        return decision
+
+    def _record(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+        increment_shared_counter(stat)
+
+    def stats(self):
+        """
+        Return decision counters and the fraction of traffic decided locally.
+        """
+
+        with self._lock:
+            local_stats = dict(self._stats)
+        result = get_counter_stats(local_stats, STATS_KEYS)
+        for counters in result.values():
+            total = sum(counters.values())
+            decided = total - counters["classifier_undecided"]
+            counters["decided_fraction"] = decided / total if total else 0.0
+        return result
+
+    def reset_stats(self):
+        """
+        Reset the counters of this process.
+        """
+
+        with self._lock:
+            self._stats = dict.fromkeys(STATS_KEYS, 0)
+
+
+classifier = LocalClassifier()
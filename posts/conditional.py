@@ -0,0 +1,63 @@
+import hashlib
+
+import orjson
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def get_etag(data):
+    """
+    Return the ETag of response data, a hash of its JSON encoding.
+    """
+
+    encoded = orjson.dumps(data, default=JSONEncoder().default)
+    return f'"{hashlib.blake2b(encoded, digest_size=16).hexdigest()}"'
+
+
+class ConditionalGetMixin:
+    """
+    Mixin answering GET requests with 304 Not Modified when the client's copy
+    of the response is current.
+
+    Successful responses carry an ETag hashing their data, which the response
+    cache stores along with them, so a poll of a cached response costs no
+    query and a poll of an uncached one costs the queries of the response,
+    without sending its body. Views showing one row can set
+    self.last_modified from it to add a Last-Modified header. Lists don't,
+    since removing a row other than the latest doesn't move the latest
+    updated_at.
+    """
+
+    last_modified = None
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK or "ETag" not in response:
+            return response
+
+        not_modified = get_conditional_response(
+            request,
+            etag=response["ETag"],
+            last_modified=parse_http_date_safe(response.get("Last-Modified", "")),
+        )
+        if not_modified is None:
+            return response
+        for header in ("ETag", "Last-Modified"):
+            if header in response:
+                not_modified[header] = response[header]
+        return not_modified
+
+    def add_validators(self, response):
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = get_etag(response.data)
+            if self.last_modified is not None:
+                response["Last-Modified"] = http_date(self.last_modified.timestamp())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.add_validators(super().list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.add_validators(super().retrieve(request, *args, **kwargs))
@@ -0,0 +1,81 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import compare_results, dump_results, run_benchmark
+
+
+class Command(BaseCommand):
+    """
+    Command to benchmark the posts API against a seeded test database.
+    """
+
+    help = (
+        "Seed a test database, drive the posts API endpoints with concurrent "
+        "clients and report throughput, latency percentiles and queries per "
+        "request as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--comments", type=int, default=10000)
+        parser.add_argument(
+            "--days", type=int, default=30, help="Days the comments span."
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per endpoint."
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--warmup", type=int, default=10, help="Unmeasured requests per endpoint."
+        )
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="Keep the API response cache enabled.",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="Compare the results with this baseline JSON file."
+        )
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            help="Fail if a compared metric got worse by more than this percent.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("posts", "requests", "concurrency", "days"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read the baseline: {e}")
+
+        results = run_benchmark(
+            posts=options["posts"],
+            comments=options["comments"],
+            days=options["days"],
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            warmup=options["warmup"],
+            response_cache=options["response_cache"],
+        )
+
+        regressions = []
+        if baseline is not None:
+            results["comparison"], regressions = compare_results(
+                baseline, results, options["max_regression"]
+            )
+
+        if options["output"]:
+            dump_results(results, options["output"])
+        self.stdout.write(json.dumps(results, indent=2))
+
+        if regressions:
+            raise CommandError("Regressions: " + ", ".join(regressions))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from posts.analytics import rebuild_comment_daily_stats
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the daily comment stats from the comments table.
+    """
+
+    help = "Rebuild the daily comment stats rollup from the comments table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", help="Start date in YYYY-MM-DD format.")
+        parser.add_argument("--date-to", help="End date in YYYY-MM-DD format.")
+
+    def handle(self, *args, **options):
+        date_from = options["date_from"]
+        date_to = options["date_to"]
+        if bool(date_from) != bool(date_to):
+            raise CommandError("--date-from and --date-to must be used together.")
+
+        if date_from:
+            date_from = parse_date(date_from)
+            date_to = parse_date(date_to)
+            if date_from is None or date_to is None:
+                raise CommandError("Invalid date format. Use YYYY-MM-DD.")
+
+        days = rebuild_comment_daily_stats(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt comment stats for {days} days."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the full-text search index from the approved posts and
+    comments.
+    """
+
+    help = "Rebuild the full-text search index from the approved posts and comments."
+
+    def handle(self, *args, **options):
+        documents = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {documents} documents."))
@@ -0,0 +1,50 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import dump_results, stress_sqlite
+
+
+class Command(BaseCommand):
+    """
+    Command to compare concurrent SQLite writes with the default settings and
+    with the high-concurrency mode.
+    """
+
+    help = (
+        "Run concurrent writer threads against a scratch SQLite file, with the "
+        "default connection settings and with SQLITE_HIGH_CONCURRENCY_OPTIONS, "
+        "and report lock errors and write throughput as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument(
+            "--transactions",
+            type=int,
+            default=200,
+            help="Write transactions per thread.",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        for name in ("threads", "transactions"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+
+        results = {}
+        for mode, sqlite_options in (
+            ("default", {}),
+            ("high_concurrency", settings.SQLITE_HIGH_CONCURRENCY_OPTIONS),
+        ):
+            results[mode] = stress_sqlite(
+                sqlite_options, options["threads"], options["transactions"]
+            )
+        before = results["default"]["commits_per_second"]
+        after = results["high_concurrency"]["commits_per_second"]
+        results["speedup"] = round(after / before, 2) if before else None
+
+        if options["output"]:
+            dump_results(results, options["output"])
+        self.stdout.write(json.dumps(results, indent=2))
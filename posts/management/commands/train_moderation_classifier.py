@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.classifier import StreamedVerdicts, save_model, train
+from posts.models import ModerationVerdict
+from posts.verdict_cache import PROMPT_VERSION
+
+
+class Command(BaseCommand):
+    """
+    Command to train the local moderation classifier from stored verdicts.
+    """
+
+    help = (
+        "Train the local moderation classifier on the stored AI model verdicts, "
+        "report its agreement with the held-out verdicts and save it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=200000,
+            help="Train on at most this many of the latest verdicts.",
+        )
+        parser.add_argument(
+            "--holdout",
+            type=int,
+            default=20,
+            help="Percent of the verdicts held out for the agreement report.",
+        )
+        parser.add_argument("--epochs", type=int, default=5)
+        parser.add_argument(
+            "--min-samples",
+            type=int,
+            default=1000,
+            help="Don't train on fewer verdicts than this.",
+        )
+        parser.add_argument(
+            "--min-agreement",
+            type=float,
+            default=0.98,
+            help="Don't save a model agreeing less with the held-out verdicts.",
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.MODERATION_CLASSIFIER_PATH,
+            help="Path of the model file.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the agreement without saving the model.",
+        )
+
+    def handle(self, *args, **options):
+        if not 0 < options["holdout"] < 100:
+            raise CommandError("--holdout must be between 1 and 99.")
+
+        verdicts = ModerationVerdict.objects.filter(prompt_version=PROMPT_VERSION)
+        # Training reads the verdicts several times, bound them to those
+        # stored now so that every pass sees the same ones.
+        latest_id = verdicts.order_by("-id").values_list("id", flat=True).first()
+        verdicts = (
+            verdicts.filter(id__lte=latest_id or 0)
+            .order_by("-created_at")
+            .values_list("content_hash", "content", "is_acceptable")[: options["limit"]]
+        )
+        count = verdicts.count()
+        if count < options["min_samples"]:
+            raise CommandError(
+                f"Only {count} verdicts stored, "
+                f"at least {options['min_samples']} are needed."
+            )
+
+        model, report = train(
+            StreamedVerdicts(verdicts),
+            holdout_percent=options["holdout"],
+            threshold=settings.MODERATION_CLASSIFIER_THRESHOLD,
+            epochs=options["epochs"],
+        )
+
+        self.stdout.write(f"Training verdicts: {report['training_samples']}")
+        self.stdout.write(f"Held-out verdicts: {report['samples']}")
+        self.stdout.write(f"Accuracy: {report['accuracy']:.2%}")
+        self.stdout.write(
+            f"Decided locally at threshold {report['threshold']}: "
+            f"{report['coverage']:.2%}"
+        )
+        self.stdout.write(f"Agreement on local decisions: {report['agreement']:.2%}")
+        self.stdout.write(
+            f"Approved: {report['approved_ok']} agreeing, "
+            f"{report['approved_wrong']} blocked by the AI model"
+        )
+        self.stdout.write(
+            f"Blocked: {report['blocked_ok']} agreeing, "
+            f"{report['blocked_wrong']} approved by the AI model"
+        )
+
+        if report["agreement"] < options["min_agreement"]:
+            raise CommandError(
+                f"Agreement below {options['min_agreement']:.2%}, "
+                "the model was not saved."
+            )
+        if options["dry_run"]:
+            return
+
+        # Workers reload the model once they see the file changed.
+        save_model(model, options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Saved the model to {options['output']}.")
+        )
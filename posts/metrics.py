@@ -0,0 +1,248 @@
+import hmac
+import os
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from .classifier import STATS_KEYS as CLASSIFIER_STATS_KEYS
+from .models import Post, Comment, Statuses
+from .prefilter import STATS_KEYS as PREFILTER_STATS_KEYS
+from .response_cache import STATS_KEYS as RESPONSE_CACHE_STATS_KEYS
+from .verdict_cache import STATS_KEYS as VERDICT_CACHE_STATS_KEYS, get_shared_counters
+
+
+# Ages, in seconds, by which the pending backlog is broken down.
+PENDING_AGE_THRESHOLDS = (0, 60, 300, 3600)
+
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Duration of GROQ API calls.",
+    ["model", "call_type"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+LLM_REQUEST_ERRORS = Counter(
+    "llm_request_errors",
+    "GROQ API calls that raised an error.",
+    ["model", "call_type", "error"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens",
+    "Tokens used by GROQ API calls.",
+    ["model", "call_type", "kind"],
+)
+MODERATION_VERDICTS = Counter(
+    "moderation_verdicts",
+    "Moderation verdicts by the stage that decided them.",
+    ["source", "verdict"],
+)
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Duration of Celery tasks.",
+    ["task", "state"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+
+@contextmanager
+def time_llm_call(model, call_type):
+    """
+    Time a GROQ API call and count it if it fails.
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        LLM_REQUEST_ERRORS.labels(model, call_type, type(e).__name__).inc()
+        raise
+    finally:
+        LLM_REQUEST_DURATION.labels(model, call_type).observe(
+            time.perf_counter() - start
+        )
+
+
+def record_token_usage(chat_completion, model, call_type):
+    """
+    Count the tokens reported in the usage of a chat completion.
+    """
+
+    usage = getattr(chat_completion, "usage", None)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if isinstance(tokens, int):
+            LLM_TOKENS.labels(model, call_type, kind.removesuffix("_tokens")).inc(
+                tokens
+            )
+
+
+def count_verdict(source, is_acceptable):
+    """
+    Count a moderation verdict and the stage that decided it.
+    """
+
+    verdict = "approved" if is_acceptable else "blocked"
+    MODERATION_VERDICTS.labels(source, verdict).inc()
+
+
+def get_queue_depths():
+    """
+    Return the number of messages waiting in each Celery queue, waiting at
+    most METRICS_BROKER_TIMEOUT seconds for the broker.
+    """
+
+    from posts_ai_api.celery import app
+
+    timeout = settings.METRICS_BROKER_TIMEOUT
+    depths = {}
+    with app.connection_for_read(
+        connect_timeout=timeout,
+        transport_options={
+            "socket_timeout": timeout,
+            "socket_connect_timeout": timeout,
+        },
+    ) as connection:
+        # Fail the probe rather than retry, so that it never stalls a scrape.
+        connection.ensure_connection(max_retries=0)
+        channel = connection.default_channel
+        for queue in settings.CELERY_TASK_QUEUES:
+            try:
+                declared = channel.queue_declare(queue=queue.name, passive=True)
+            except Exception:
+                # The queue doesn't exist until a worker consumes it.
+                continue
+            depths[queue.name] = declared.message_count
+    return depths
+
+
+class PipelineCollector:
+    """
+    Collector reading the state shared by all workers at scrape time: the
+    pending backlog in the database, the Celery queue depths and the
+    counters kept in the shared caches.
+    """
+
+    def collect(self):
+        yield self.collect_pending_backlog()
+
+        queue_messages = GaugeMetricFamily(
+            "celery_queue_messages",
+            "Messages waiting in a Celery queue.",
+            labels=["queue"],
+        )
+        try:
+            for queue, depth in get_queue_depths().items():
+                queue_messages.add_metric([queue], depth)
+        except Exception as e:
+            print("Error reading the Celery queue depths: ", e)
+        yield queue_messages
+
+        yield self.collect_shared_counters(
+            "verdict_cache_lookups",
+            "Moderation verdict cache lookups of all workers.",
+            "result",
+            VERDICT_CACHE_STATS_KEYS,
+        )
+        yield self.collect_shared_counters(
+            "prefilter_decisions",
+            "Decisions of the moderation pre-filter of all workers.",
+            "decision",
+            PREFILTER_STATS_KEYS,
+            prefix="prefilter_",
+        )
+        yield self.collect_shared_counters(
+            "classifier_decisions",
+            "Decisions of the local moderation classifier of all workers.",
+            "decision",
+            CLASSIFIER_STATS_KEYS,
+            prefix="classifier_",
+        )
+        yield self.collect_shared_counters(
+            "response_cache_lookups",
+            "API response cache lookups of all web workers.",
+            "result",
+            RESPONSE_CACHE_STATS_KEYS,
+            prefix="response_cache_",
+            cache_alias="default",
+        )
+
+    def collect_pending_backlog(self):
+        pending = GaugeMetricFamily(
+            "moderation_pending_items",
+            "Items pending moderation for longer than older_than seconds.",
+            labels=["model", "older_than"],
+        )
+        now = timezone.now()
+        for model in (Post, Comment):
+            counts = model.objects.filter(status=Statuses.PENDING).aggregate(
+                **{
+                    str(age): Count(
+                        "id", filter=Q(created_at__lte=now - timedelta(seconds=age))
+                    )
+                    for age in PENDING_AGE_THRESHOLDS
+                }
+            )
+            for age, count in counts.items():
+                pending.add_metric([model._meta.model_name, age], count)
+        return pending
+
+    def collect_shared_counters(
+        self, name, documentation, label, keys, prefix="", cache_alias="moderation"
+    ):
+        counter = CounterMetricFamily(name, documentation, labels=[label])
+        for key, value in get_shared_counters(keys, cache_alias=cache_alias).items():
+            counter.add_metric([key.removeprefix(prefix)], value)
+        return counter
+
+
+class RegistryCollector:
+    """
+    Collector exposing the metrics of another registry.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def collect(self):
+        return self.registry.collect()
+
+
+def is_metrics_client(request):
+    """
+    Return whether a request may read the metrics: it comes from one of
+    METRICS_ALLOWED_IPS or carries the METRICS_TOKEN bearer token.
+    """
+
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return (
+        bool(settings.METRICS_TOKEN)
+        and scheme == "Bearer"
+        and hmac.compare_digest(token, settings.METRICS_TOKEN)
+    )
+
+
+def get_registry():
+    """
+    Return a registry with the metrics of every process and the pipeline
+    state.
+
+    With PROMETHEUS_MULTIPROC_DIR set, the metrics of all web and Celery
+    worker processes of the host are aggregated from the files they write
+    there. Otherwise only the metrics of this process are exposed.
+    """
+
+    registry = CollectorRegistry(auto_describe=False)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        MultiProcessCollector(registry)
+    else:
+        registry.register(RegistryCollector(REGISTRY))
+    registry.register(PipelineCollector())
+    return registry
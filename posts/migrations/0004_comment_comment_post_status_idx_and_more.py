@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("posts", "0003_remove_comment_is_blocked_remove_post_is_blocked_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "status", "created_at", "id"],
+                name="comment_post_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["created_at"], name="comment_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["status", "created_at", "id"], name="post_status_created_idx"
+            ),
+        ),
+    ]
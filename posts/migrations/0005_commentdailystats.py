@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("posts", "0004_comment_comment_post_status_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CommentDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("total_comments", models.IntegerField(default=0)),
+                ("pending_comments", models.IntegerField(default=0)),
+                ("approved_comments", models.IntegerField(default=0)),
+                ("blocked_comments", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "comment daily stats",
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0006_moderation_retries"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScheduledAutoResponse",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("due_at", models.DateTimeField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "comment",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="scheduled_auto_response",
+                        to="posts.comment",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["due_at"], name="scheduled_response_due_idx")
+                ],
+            },
+        ),
+    ]
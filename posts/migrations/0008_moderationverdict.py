@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-17 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0007_scheduledautoresponse"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ModerationVerdict",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64)),
+                ("content", models.TextField()),
+                ("is_acceptable", models.BooleanField()),
+                ("prompt_version", models.PositiveIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("content_hash", "prompt_version"),
+                        name="verdict_content_version_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 5.1.2 on 2026-10-17 12:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# External content FTS5 table kept in sync with posts_searchdocument by
+# triggers. SQLite drops triggers when Django rebuilds a table to alter it,
+# so migrations altering posts_searchdocument must create them again.
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE posts_searchdocument_fts USING fts5(
+        title,
+        content,
+        content='posts_searchdocument',
+        content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER posts_searchdocument_fts_insert
+    AFTER INSERT ON posts_searchdocument BEGIN
+        INSERT INTO posts_searchdocument_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_searchdocument_fts_delete
+    AFTER DELETE ON posts_searchdocument BEGIN
+        INSERT INTO posts_searchdocument_fts
+            (posts_searchdocument_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_searchdocument_fts_update
+    AFTER UPDATE ON posts_searchdocument BEGIN
+        INSERT INTO posts_searchdocument_fts
+            (posts_searchdocument_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_searchdocument_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS posts_searchdocument_fts_update",
+    "DROP TRIGGER IF EXISTS posts_searchdocument_fts_delete",
+    "DROP TRIGGER IF EXISTS posts_searchdocument_fts_insert",
+    "DROP TABLE IF EXISTS posts_searchdocument_fts",
+]
+
+POSTGRESQL_CREATE = [
+    """
+    ALTER TABLE posts_searchdocument ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A')
+        || setweight(to_tsvector('english', content), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX posts_searchdocument_vector_idx
+    ON posts_searchdocument USING GIN (search_vector)
+    """,
+]
+
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS posts_searchdocument_vector_idx",
+    "ALTER TABLE posts_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_for_vendor(statements):
+    """
+    Return a RunPython function executing the statements of the database
+    vendor, if any. Other backends search with LIKE and need no index.
+    """
+
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0008_moderationverdict"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("title", models.CharField(blank=True, max_length=255)),
+                ("content", models.TextField()),
+                ("created_at", models.DateTimeField()),
+                (
+                    "comment",
+                    models.OneToOneField(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="posts.comment",
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="posts.post",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("comment__isnull", True)),
+                        fields=("post",),
+                        name="search_document_post_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            run_for_vendor({"sqlite": SQLITE_CREATE, "postgresql": POSTGRESQL_CREATE}),
+            run_for_vendor({"sqlite": SQLITE_DROP, "postgresql": POSTGRESQL_DROP}),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-17 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0010_searchdocument"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="moderation_leased_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="moderation_leased_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Value, When
 from django.conf import settings
+from django.utils import timezone
 
 
 class Statuses(models.TextChoices):
@@ -10,6 +12,67 @@ class Statuses(models.TextChoices):
     PENDING = "pending", "Pending"
     APPROVED = "approved", "Approved"
     BLOCKED = "blocked", "Blocked"
+    # Moderation failed MODERATION_MAX_ATTEMPTS times, see moderation_error.
+    FAILED = "failed", "Failed"
+
+
+class ModeratedQuerySet(models.QuerySet):
+    """
+    QuerySet with conditional, single-statement status transitions.
+    """
+
+    def transition(self, pk, to_status, from_status=Statuses.PENDING):
+        """
+        Move an object from from_status to to_status with one conditional
+        UPDATE. Returns whether the transition happened.
+        """
+
+        updated = self.filter(pk=pk, status=from_status).update(
+            status=to_status, updated_at=timezone.now()
+        )
+        return updated == 1
+
+    def bulk_transition(self, new_statuses, from_status=Statuses.PENDING):
+        """
+        Move many objects from from_status to their new status, given as a
+        {pk: status} mapping, with one locking SELECT and one conditional
+        UPDATE for the whole batch.
+
+        Returns the ids of the objects that were transitioned.
+        """
+
+        with transaction.atomic(using=self.db):
+            transitioned_ids = list(
+                self.select_for_update()
+                .filter(pk__in=new_statuses, status=from_status)
+                .values_list("pk", flat=True)
+            )
+            if not transitioned_ids:
+                return []
+
+            ids_by_status = {}
+            for pk in transitioned_ids:
+                ids_by_status.setdefault(new_statuses[pk], []).append(pk)
+
+            self.filter(pk__in=transitioned_ids, status=from_status).update(
+                status=Case(
+                    *(
+                        When(pk__in=ids, then=Value(status))
+                        for status, ids in ids_by_status.items()
+                    )
+                ),
+                updated_at=timezone.now(),
+            )
+        return transitioned_ids
+
+    def record_error(self, pks, error, status=Statuses.PENDING):
+        """
+        Store the last moderation error of objects still in the status.
+        """
+
+        return self.filter(pk__in=pks, status=status).update(
+            moderation_error=str(error)
+        )
 
 
 class Post(models.Model):
@@ -27,6 +90,22 @@ class Post(models.Model):
     status = models.CharField(
         max_length=20, choices=Statuses.choices, default=Statuses.PENDING
     )
+    moderation_attempts = models.PositiveIntegerField(default=0)
+    moderation_error = models.TextField(blank=True, default="")
+    # Set while a drain_pending_moderation run holds the object in a batch.
+    moderation_leased_until = models.DateTimeField(null=True, blank=True)
+
+    objects = ModeratedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "created_at", "id"], name="post_status_created_idx"
+            ),
+            models.Index(
+                fields=["status", "updated_at"], name="post_status_updated_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -47,6 +126,119 @@ class Comment(models.Model):
     status = models.CharField(
         max_length=20, choices=Statuses.choices, default=Statuses.PENDING
     )
+    moderation_attempts = models.PositiveIntegerField(default=0)
+    moderation_error = models.TextField(blank=True, default="")
+    # Set while a drain_pending_moderation run holds the object in a batch.
+    moderation_leased_until = models.DateTimeField(null=True, blank=True)
+
+    objects = ModeratedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "status", "created_at", "id"],
+                name="comment_post_status_idx",
+            ),
+            models.Index(fields=["created_at"], name="comment_created_idx"),
+            models.Index(
+                fields=["status", "updated_at"], name="comment_status_updated_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.author}: {self.content}"
+
+
+class ScheduledAutoResponse(models.Model):
+    """
+    Model representing an automatic response to a comment, due to be
+    generated at due_at.
+    """
+
+    comment = models.OneToOneField(
+        Comment, on_delete=models.CASCADE, related_name="scheduled_auto_response"
+    )
+    due_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["due_at"], name="scheduled_response_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.comment_id}: {self.due_at}"
+
+
+class ModerationVerdict(models.Model):
+    """
+    Model representing a verdict of the AI model on some content, kept to
+    train the local moderation classifier.
+    """
+
+    content_hash = models.CharField(max_length=64)
+    content = models.TextField()
+    is_acceptable = models.BooleanField()
+    prompt_version = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_hash", "prompt_version"],
+                name="verdict_content_version_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash}: {self.is_acceptable}"
+
+
+class SearchDocument(models.Model):
+    """
+    Model representing an approved post or comment in the full-text index.
+
+    Documents of posts have no comment. The full-text index itself is
+    backend specific and created by migration 0010: an FTS5 table kept in
+    sync by triggers on SQLite, a generated tsvector column with a GIN index
+    on Postgres.
+    """
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    comment = models.OneToOneField(
+        Comment, on_delete=models.CASCADE, null=True, related_name="+"
+    )
+    title = models.CharField(max_length=255, blank=True)
+    content = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post"],
+                condition=models.Q(comment__isnull=True),
+                name="search_document_post_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id}/{self.comment_id}: {self.title or self.content}"
+
+
+class CommentDailyStats(models.Model):
+    """
+    Model representing the number of comments created on a day, by status.
+    """
+
+    date = models.DateField(unique=True)
+    total_comments = models.IntegerField(default=0)
+    pending_comments = models.IntegerField(default=0)
+    approved_comments = models.IntegerField(default=0)
+    blocked_comments = models.IntegerField(default=0)
+    failed_comments = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "comment daily stats"
+
+    def __str__(self):
+        return f"{self.date}: {self.total_comments}"
@@ -0,0 +1,251 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class LinkPagination(BasePagination):
+    """
+    Base pagination answering with the results of a page and links to the
+    next and previous ones.
+    """
+
+    page_size_query_param = "page_size"
+    page_size = 20
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class KeysetPagination(LinkPagination):
+    """
+    Cursor pagination over the (created_at, id) key.
+
+    Each page is fetched with an index-friendly range condition on the key of
+    the last row seen, so its cost doesn't depend on how deep it is, no
+    OFFSET or COUNT(*) is used, and rows inserted concurrently never shift
+    items between pages.
+    """
+
+    cursor_query_param = "cursor"
+    descending = True
+    invalid_cursor_message = "Invalid cursor."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        reverse = position is not None and position["reverse"]
+        descending = self.descending != reverse
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position, descending))
+
+        prefix = "-" if descending else ""
+        rows = list(
+            queryset.order_by(f"{prefix}created_at", f"{prefix}id")[
+                : self.page_size + 1
+            ]
+        )
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            self.next_position = self.previous_position = None
+        elif reverse:
+            self.next_position = self.get_position(rows[-1], reverse=False)
+            self.previous_position = (
+                self.get_position(rows[0], reverse=True) if has_more else None
+            )
+        else:
+            self.next_position = (
+                self.get_position(rows[-1], reverse=False) if has_more else None
+            )
+            self.previous_position = (
+                self.get_position(rows[0], reverse=True)
+                if position is not None
+                else None
+            )
+        return rows
+
+    def get_position(self, row, reverse):
+        if isinstance(row, dict):
+            # A values() row.
+            return {
+                "created_at": row["created_at"],
+                "id": row["id"],
+                "reverse": reverse,
+            }
+        return {"created_at": row.created_at, "id": row.id, "reverse": reverse}
+
+    def get_position_filter(self, position, descending):
+        lookup = "lt" if descending else "gt"
+        return Q(**{f"created_at__{lookup}": position["created_at"]}) | Q(
+            created_at=position["created_at"], **{f"id__{lookup}": position["id"]}
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            return {
+                "created_at": datetime.fromisoformat(data["c"]),
+                "id": int(data["i"]),
+                "reverse": bool(data["r"]),
+            }
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        data = {
+            "c": position["created_at"].isoformat(),
+            "i": position["id"],
+            "r": int(position["reverse"]),
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode("utf-8"))
+        return encoded.decode("ascii")
+
+    def get_link(self, position):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position)
+        )
+
+    def get_next_link(self):
+        return self.get_link(self.next_position)
+
+    def get_previous_link(self):
+        return self.get_link(self.previous_position)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
+class PostPagination(KeysetPagination):
+    """
+    Pagination of posts, newest first.
+    """
+
+    descending = True
+
+
+class CommentPagination(KeysetPagination):
+    """
+    Pagination of comments, oldest first.
+    """
+
+    descending = False
+
+
+class SearchPagination(LinkPagination):
+    """
+    Pagination of ranked search results by page number.
+
+    Ranked results have no stable key to seek from, so pages are fetched
+    with OFFSET, which is cheap for the first pages people actually look at.
+    One extra result is fetched to tell whether there is a next page, no
+    COUNT(*) is used, and pages past max_page are not served.
+    """
+
+    page_query_param = "page"
+    max_page = 50
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.page = _positive_int(
+                request.query_params.get(self.page_query_param, 1), strict=True
+            )
+        except ValueError:
+            raise NotFound("Invalid page.")
+        if self.page > self.max_page:
+            raise NotFound(f"Only the first {self.max_page} pages are served.")
+
+        offset = (self.page - 1) * self.page_size
+        results = queryset[offset : offset + self.page_size + 1]
+        self.has_next = len(results) > self.page_size and self.page < self.max_page
+        return results[: self.page_size]
+
+    def get_link(self, page):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, page)
+
+    def get_next_link(self):
+        return self.get_link(self.page + 1) if self.has_next else None
+
+    def get_previous_link(self):
+        return self.get_link(self.page - 1) if self.page > 1 else None
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.page_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Page number of the results.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+        ]
@@ -0,0 +1,213 @@
+import os
+import string
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .verdict_cache import (
+    normalize_content,
+    increment_shared_counter,
+    get_counter_stats,
+)
+
+
+BLOCK = "block"
+APPROVE = "approve"
+UNDECIDED = "undecided"
+
+STATS = {
+    BLOCK: "prefilter_blocked",
+    APPROVE: "prefilter_approved",
+    UNDECIDED: "prefilter_undecided",
+}
+STATS_KEYS = tuple(STATS.values())
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton matching many patterns in a single pass over text.
+    """
+
+    def __init__(self, patterns):
+        self.transitions = [{}]
+        self.failures = [0]
+        self.outputs = [()]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions[state][char] = next_state
+                    self.transitions.append({})
+                    self.failures.append(0)
+                    self.outputs.append(())
+                state = next_state
+            self.outputs[state] += (pattern,)
+
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                failure = self.failures[state]
+                while failure and char not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                self.failures[next_state] = self.transitions[failure].get(char, 0)
+                self.outputs[next_state] += self.outputs[self.failures[next_state]]
+
+    def iter_matches(self, text):
+        """
+        Yield (start, end) offsets of every pattern occurrence in the text.
+        """
+
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self.transitions[state]:
+                state = self.failures[state]
+            state = self.transitions[state].get(char, 0)
+            for pattern in self.outputs[state]:
+                yield index - len(pattern) + 1, index + 1
+
+
+def is_word_boundary(text, start, end):
+    """
+    Check that a match is not part of a longer word.
+    """
+
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def read_wordlist(path):
+    """
+    Read a wordlist file with one term per line and # comments.
+    """
+
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as wordlist:
+        terms = (normalize_content(line.split("#", 1)[0]) for line in wordlist)
+        return [term for term in terms if term]
+
+
+def get_mtime(path):
+    """
+    Return the modification time of a file, or None if it doesn't exist.
+    """
+
+    try:
+        return os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+
+class PreFilter:
+    """
+    Lexical pre-filter that decides obvious cases before the AI model.
+
+    Content containing a blocklisted term is blocked, short content made only
+    of allowlisted words is approved, everything else is left undecided. The
+    wordlists are reloaded when their files change, without a restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._checked_at = 0
+        self._stats = dict.fromkeys(STATS_KEYS, 0)
+
+    def _paths(self):
+        return (
+            settings.MODERATION_BLOCKLIST_PATH,
+            settings.MODERATION_ALLOWLIST_PATH,
+        )
+
+    def _load(self):
+        blocklist_path, allowlist_path = self._paths()
+        return {
+            "mtimes": (get_mtime(blocklist_path), get_mtime(allowlist_path)),
+            "automaton": Automaton(read_wordlist(blocklist_path)),
+            "allowlist": frozenset(read_wordlist(allowlist_path)),
+        }
+
+    def _get_state(self):
+        now = time.monotonic()
+        state = self._state
+        if (
+            state is not None
+            and now - self._checked_at < settings.MODERATION_PREFILTER_RELOAD_INTERVAL
+        ):
+            return state
+
+        with self._lock:
+            self._checked_at = now
+            mtimes = tuple(get_mtime(path) for path in self._paths())
+            if self._state is None or self._state["mtimes"] != mtimes:
+                self._state = self._load()
+            return self._state
+
+    def reload(self):
+        """
+        Rebuild the automaton from the wordlist files.
+        """
+
+        with self._lock:
+            self._state = self._load()
+            self._checked_at = time.monotonic()
+
+    def check(self, content):
+        """
+        Return BLOCK, APPROVE or UNDECIDED for the content.
+        """
+
+        state = self._get_state()
+        text = normalize_content(content)
+
+        verdict = UNDECIDED
+        for start, end in state["automaton"].iter_matches(text):
+            if is_word_boundary(text, start, end):
+                verdict = BLOCK
+                break
+        else:
+            if len(text) <= settings.MODERATION_PREFILTER_APPROVE_MAX_LENGTH:
+                words = (word.strip(string.punctuation) for word in text.split())
+                if all(not word or word in state["allowlist"] for word in words):
+                    verdict = APPROVE
+
+        self._record(STATS[verdict])
+        return verdict
+
+    def _record(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+        increment_shared_counter(stat)
+
+    def stats(self):
+        """
+        Return decision counters and the fraction of traffic decided locally.
+        """
+
+        with self._lock:
+            local_stats = dict(self._stats)
+        result = get_counter_stats(local_stats, STATS_KEYS)
+        for counters in result.values():
+            total = sum(counters.values())
+            decided = total - counters["prefilter_undecided"]
+            counters["decided_fraction"] = decided / total if total else 0.0
+        return result
+
+    def reset_stats(self):
+        """
+        Reset the counters of this process.
+        """
+
+        with self._lock:
+            self._stats = dict.fromkeys(STATS_KEYS, 0)
+
+
+prefilter = PreFilter()
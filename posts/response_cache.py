@@ -0,0 +1,184 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from posts_ai_api.db_routing import primary_reads, replica_reads
+
+from .verdict_cache import increment_shared_counter, get_shared_counters
+
+
+POSTS_SCOPE = "posts"
+
+STATS_KEYS = ("response_cache_hits", "response_cache_misses")
+
+# Headers cached along with the data, so that hits carry the same validators.
+CACHED_HEADERS = ("ETag", "Last-Modified")
+
+
+def get_post_scope(post_id):
+    return f"post:{post_id}"
+
+
+def get_comments_scope(post_id):
+    return f"post:{post_id}:comments"
+
+
+def get_version_key(scope):
+    return f"responses:version:{scope}"
+
+
+def get_invalidated_key(scope):
+    return f"responses:invalidated:{scope}"
+
+
+def is_recently_invalidated(scopes):
+    """
+    Return whether any of the scopes was invalidated in the last
+    DATABASE_PRIMARY_PIN_SECONDS, when replicas may still lag behind.
+    """
+
+    return bool(cache.get_many([get_invalidated_key(scope) for scope in scopes]))
+
+
+def get_versions(scopes):
+    """
+    Return the current version of each scope.
+
+    Missing versions start from the current time, so a version lost to
+    eviction never matches the key of a response cached before it.
+    """
+
+    keys = [get_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """
+    Invalidate every cached response of the scopes by bumping their versions.
+
+    When called inside a transaction, the versions are bumped after commit.
+    With read replicas, the scopes are flagged as recently invalidated before
+    their versions are bumped, so that no response read from a lagging
+    replica is cached under the new versions.
+    """
+
+    def bump():
+        if settings.DATABASE_READ_REPLICAS:
+            cache.set_many(
+                {get_invalidated_key(scope): True for scope in scopes},
+                settings.DATABASE_PRIMARY_PIN_SECONDS,
+            )
+        for scope in scopes:
+            key = get_version_key(scope)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def invalidate_post(post_id):
+    """
+    Invalidate cached responses showing a post.
+    """
+
+    invalidate(POSTS_SCOPE, get_post_scope(post_id))
+
+
+def invalidate_posts(post_ids):
+    """
+    Invalidate cached responses showing any of the posts.
+    """
+
+    invalidate(POSTS_SCOPE, *(get_post_scope(post_id) for post_id in post_ids))
+
+
+def invalidate_comments(post_ids):
+    """
+    Invalidate cached comment lists of the posts.
+    """
+
+    invalidate(*(get_comments_scope(post_id) for post_id in set(post_ids)))
+
+
+def get_response_cache_stats():
+    """
+    Return the hit/miss counters of all workers and the hit ratio.
+    """
+
+    stats = get_shared_counters(STATS_KEYS, cache_alias="default")
+    total = sum(stats.values())
+    stats["hit_ratio"] = stats["response_cache_hits"] / total if total else 0.0
+    return stats
+
+
+class CachedResponseMixin:
+    """
+    Mixin caching successful GET responses under versioned keys.
+
+    Views define the scopes their response depends on, and writes bump the
+    version of the scopes they change, so invalidation is O(1). Misses
+    following an invalidation read from the primary. Responses are only
+    cached with RESPONSE_CACHE_ENABLED, which needs a shared cache. Responses
+    carry an X-Cache header and an Age header telling how old the cached
+    data is.
+    """
+
+    def get_cache_scopes(self):
+        raise NotImplementedError
+
+    def get_cache_key(self, request):
+        versions = get_versions(self.get_cache_scopes())
+        raw_key = f"{request.build_absolute_uri()}|{versions}"
+        return "responses:" + hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return handler(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            data, cached_at, headers = entry
+            increment_shared_counter("response_cache_hits", cache_alias="default")
+            response = Response(data, headers=headers)
+            response["X-Cache"] = "HIT"
+            response["Age"] = str(int(time.time() - cached_at))
+            return response
+
+        increment_shared_counter("response_cache_misses", cache_alias="default")
+        if replica_reads.get() and is_recently_invalidated(self.get_cache_scopes()):
+            with primary_reads():
+                response = handler(request, *args, **kwargs)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            headers = {
+                header: response[header]
+                for header in CACHED_HEADERS
+                if response.has_header(header)
+            }
+            cache.set(
+                key,
+                (response.data, time.time(), headers),
+                settings.RESPONSE_CACHE_TTL,
+            )
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args, **kwargs)
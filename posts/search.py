@@ -0,0 +1,184 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q, Value, FloatField
+
+from .models import Post, Comment, SearchDocument, Statuses
+
+
+WORD_RE = re.compile(r"\w+")
+
+SEARCH_COLUMNS = "d.id, d.post_id, d.comment_id, d.title, d.content, d.created_at"
+
+# bm25() ranks better matches lower, titles weigh twice as much as content.
+SQLITE_SEARCH = f"""
+    SELECT {SEARCH_COLUMNS}, -bm25(posts_searchdocument_fts, 2.0, 1.0) AS rank
+    FROM posts_searchdocument_fts
+    JOIN posts_searchdocument d ON d.id = posts_searchdocument_fts.rowid
+    WHERE posts_searchdocument_fts MATCH %s {{kind}}
+    ORDER BY rank DESC, d.id DESC
+    LIMIT %s OFFSET %s
+"""
+
+POSTGRESQL_SEARCH = f"""
+    SELECT {SEARCH_COLUMNS}, ts_rank(d.search_vector, query) AS rank
+    FROM posts_searchdocument d, websearch_to_tsquery('english', %s) query
+    WHERE d.search_vector @@ query {{kind}}
+    ORDER BY rank DESC, d.id DESC
+    LIMIT %s OFFSET %s
+"""
+
+KIND_FILTERS = {
+    None: "",
+    "post": "AND d.comment_id IS NULL",
+    "comment": "AND d.comment_id IS NOT NULL",
+}
+
+
+def get_fts_query(query):
+    """
+    Turn user input into an FTS5 query matching documents containing every
+    word, so that FTS5 operators in the input are searched for as plain
+    words.
+    """
+
+    words = WORD_RE.findall(query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+class SearchResults:
+    """
+    Lazy, ranked full-text search results, fetched one slice at a time with
+    LIMIT and OFFSET.
+    """
+
+    def __init__(self, query, kind=None):
+        self.query = query
+        self.kind = kind
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError("Search results only support slicing.")
+        start = key.start or 0
+        return self.fetch(key.stop - start, start)
+
+    def fetch(self, limit, offset):
+        vendor = connection.vendor
+        if vendor == "sqlite":
+            query = get_fts_query(self.query)
+            if query is None:
+                return []
+            sql = SQLITE_SEARCH
+        elif vendor == "postgresql":
+            query = self.query
+            sql = POSTGRESQL_SEARCH
+        else:
+            return self.fetch_unindexed(limit, offset)
+
+        return list(
+            SearchDocument.objects.raw(
+                sql.format(kind=KIND_FILTERS[self.kind]), [query, limit, offset]
+            )
+        )
+
+    def fetch_unindexed(self, limit, offset):
+        # Backends without a full-text index scan with LIKE, unranked.
+        documents = SearchDocument.objects.filter(
+            Q(title__icontains=self.query) | Q(content__icontains=self.query)
+        )
+        if self.kind is not None:
+            documents = documents.filter(comment__isnull=self.kind == "post")
+        return list(
+            documents.annotate(rank=Value(0.0, output_field=FloatField())).order_by(
+                "-id"
+            )[offset : offset + limit]
+        )
+
+
+def get_document(obj):
+    if isinstance(obj, Post):
+        return SearchDocument(
+            post_id=obj.id,
+            title=obj.title,
+            content=obj.content,
+            created_at=obj.created_at,
+        )
+    return SearchDocument(
+        post_id=obj.post_id,
+        comment_id=obj.id,
+        content=obj.content,
+        created_at=obj.created_at,
+    )
+
+
+def index_objects(objects):
+    """
+    Replace the search documents of posts or comments, indexing the approved
+    ones only.
+    """
+
+    objects = list(objects)
+    if not objects:
+        return
+
+    ids = [obj.id for obj in objects]
+    if isinstance(objects[0], Post):
+        documents = SearchDocument.objects.filter(post_id__in=ids, comment=None)
+    else:
+        documents = SearchDocument.objects.filter(comment_id__in=ids)
+
+    with transaction.atomic():
+        documents.delete()
+        SearchDocument.objects.bulk_create(
+            get_document(obj) for obj in objects if obj.status == Statuses.APPROVED
+        )
+
+
+def index_posts(post_ids):
+    """
+    Sync the search documents of posts, after they were moderated.
+    """
+
+    index_objects(
+        Post.objects.filter(id__in=post_ids).only(
+            "id", "title", "content", "created_at", "status"
+        )
+    )
+
+
+def index_comments(comment_ids):
+    """
+    Sync the search documents of comments, after they were moderated.
+    """
+
+    index_objects(
+        Comment.objects.filter(id__in=comment_ids).only(
+            "id", "post_id", "content", "created_at", "status"
+        )
+    )
+
+
+def rebuild_search_index(batch_size=1000):
+    """
+    Rebuild the search documents from the approved posts and comments.
+
+    Returns the number of documents.
+    """
+
+    documents = 0
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for model in (Post, Comment):
+            objects = model.objects.filter(status=Statuses.APPROVED).order_by("id")
+            batch = []
+            for obj in objects.iterator(chunk_size=batch_size):
+                batch.append(get_document(obj))
+                if len(batch) == batch_size:
+                    SearchDocument.objects.bulk_create(batch)
+                    documents += len(batch)
+                    batch = []
+            SearchDocument.objects.bulk_create(batch)
+            documents += len(batch)
+    return documents
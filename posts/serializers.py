@@ -1,9 +1,16 @@
-from rest_framework import serializers
+from functools import cached_property
 
-from .models import Post, Comment
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 
+from posts_ai_api.profiling import TimedListSerializer, TimedSerializerMixin
 
-class PostSerializer(serializers.ModelSerializer):
+from .models import Post, Comment, SearchDocument
+
+
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Post model.
     """
@@ -22,9 +29,11 @@ class PostSerializer(serializers.ModelSerializer):
             "status",
         ]
         read_only_fields = ["id", "author", "created_at", "updated_at", "status"]
+        extra_kwargs = {"content": {"max_length": settings.POST_CONTENT_MAX_LENGTH}}
+        list_serializer_class = TimedListSerializer
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Comment model.
     """
@@ -50,3 +59,117 @@ class CommentSerializer(serializers.ModelSerializer):
             "updated_at",
             "status",
         ]
+        extra_kwargs = {"content": {"max_length": settings.COMMENT_CONTENT_MAX_LENGTH}}
+        list_serializer_class = TimedListSerializer
+
+
+class SearchResultSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for full-text search results.
+    """
+
+    type = serializers.SerializerMethodField()
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SearchDocument
+        fields = ["type", "post", "comment", "title", "content", "created_at", "rank"]
+        read_only_fields = fields
+        list_serializer_class = TimedListSerializer
+
+    def get_type(self, document) -> str:
+        return "post" if document.comment_id is None else "comment"
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer building the output of a ModelSerializer from
+    values() rows, without instantiating its fields for every row.
+
+    Each field is read from the values() lookup of its source. Only fields
+    whose representation differs from the database value, like datetimes,
+    are converted, by their ModelSerializer field. ISO 8601 datetimes in the
+    current timezone, the default, are formatted here like DRF does, with
+    the timezone looked up once per page instead of once per value.
+    """
+
+    converted_fields = (serializers.DateTimeField, serializers.DateField)
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def fields(self):
+        return self.serializer_class().fields
+
+    @cached_property
+    def lookups(self):
+        return {
+            name: "__".join(field.source_attrs) for name, field in self.fields.items()
+        }
+
+    @cached_property
+    def datetime_fields(self):
+        return [
+            name
+            for name, field in self.fields.items()
+            if is_default_datetime_field(field)
+        ]
+
+    @cached_property
+    def converters(self):
+        return {
+            name: field.to_representation
+            for name, field in self.fields.items()
+            if isinstance(field, self.converted_fields)
+            and name not in self.datetime_fields
+        }
+
+    def get_values(self, queryset):
+        """
+        Return the queryset as values() rows with every field needed.
+        """
+
+        return queryset.values(*set(self.lookups.values()))
+
+    def to_representation(self, rows):
+        lookups = list(self.lookups.items())
+        converters = list(self.converters.items())
+        datetime_fields = self.datetime_fields
+        current_timezone = timezone.get_current_timezone()
+        data = []
+        for row in rows:
+            item = {name: row[lookup] for name, lookup in lookups}
+            for name in datetime_fields:
+                if item[name]:
+                    item[name] = format_datetime(item[name], current_timezone)
+            for name, convert in converters:
+                if item[name] is not None:
+                    item[name] = convert(item[name])
+            data.append(item)
+        return data
+
+
+def is_default_datetime_field(field):
+    """
+    Check that a field represents aware datetimes in ISO 8601 in the current
+    timezone, as format_datetime does.
+    """
+
+    return (
+        isinstance(field, serializers.DateTimeField)
+        and settings.USE_TZ
+        and not hasattr(field, "timezone")
+        and getattr(field, "format", api_settings.DATETIME_FORMAT) == ISO_8601
+    )
+
+
+def format_datetime(value, current_timezone):
+    """
+    Format an aware datetime like the DRF DateTimeField does by default.
+    """
+
+    value = value.astimezone(current_timezone).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
@@ -0,0 +1,96 @@
+import os
+import time
+
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+)
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from prometheus_client import multiprocess, start_http_server
+
+from .analytics import record_comments_created, record_comments_deleted
+from .metrics import TASK_DURATION, get_registry
+from .models import Post, Comment, Statuses
+from .search import index_objects
+
+
+# Start times of the tasks running in this process, by task id.
+task_starts = {}
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    """
+    Count a new comment in the daily stats.
+    """
+
+    if created:
+        record_comments_created([instance])
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def index_saved_object(sender, instance, created, **kwargs):
+    """
+    Sync the search document of an edited post or comment. Deleted ones lose
+    theirs by cascade.
+    """
+
+    if not created or instance.status == Statuses.APPROVED:
+        index_objects([instance])
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    """
+    Remove a deleted comment from the daily stats.
+    """
+
+    record_comments_deleted([instance])
+
+
+@task_prerun.connect
+def start_task_timer(task_id, **kwargs):
+    """
+    Remember when a Celery task started.
+    """
+
+    task_starts[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observe_task_duration(task_id, task, state=None, **kwargs):
+    """
+    Record the duration of a finished Celery task.
+    """
+
+    start = task_starts.pop(task_id, None)
+    if start is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - start
+        )
+
+
+@worker_init.connect
+def start_worker_metrics_server(**kwargs):
+    """
+    Expose the metrics of a Celery worker host without a web process on
+    METRICS_WORKER_PORT.
+    """
+
+    if settings.METRICS_WORKER_PORT:
+        start_http_server(settings.METRICS_WORKER_PORT, registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):
+    """
+    Drop the live metrics of an exiting worker process in multiprocess mode.
+    """
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -1,57 +1,467 @@
+import time
+from datetime import timedelta
+from functools import partial
+
 from celery import shared_task
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from groq import RateLimitError
 
-from .models import Post, Comment, Statuses
-from .utils import moderate_content, generate_response_content
+from posts_ai_api.ai_client import run_async
+from posts_ai_api.rate_limit import get_retry_after
 
+from .analytics import record_comments_created, record_status_changes
+from .models import Post, Comment, ScheduledAutoResponse, Statuses
+from .response_cache import invalidate_post, invalidate_posts, invalidate_comments
+from .search import index_objects, index_posts, index_comments
+from .utils import (
+    get_moderation_verdict,
+    get_moderation_verdicts,
+    generate_response_content,
+    agenerate_responses,
+)
 
-@shared_task
-def moderate_post_content(post_id):
+
+def schedule_auto_responses(comments):
+    """
+    Schedule automatic responses to approved comments whose post author has
+    enabled them. They are generated by dispatch_auto_responses once due.
+    """
+
+    now = timezone.now()
+    ScheduledAutoResponse.objects.bulk_create(
+        [
+            ScheduledAutoResponse(
+                comment=comment,
+                due_at=now + timedelta(minutes=comment.post.author.auto_response_delay),
+            )
+            for comment in comments
+            if comment.post.author.auto_response_enabled
+            and comment.post.author_id != comment.author_id
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def get_rate_limit_countdown(error):
+    """
+    Return how long a rate-limited task waits before it is retried.
+    """
+
+    return get_retry_after(error) or settings.GROQ_RETRY_BACKOFF_MAX
+
+
+def get_verdict_status(is_acceptable):
+    """
+    Return the status matching a moderation verdict.
+    """
+
+    return Statuses.APPROVED if is_acceptable else Statuses.BLOCKED
+
+
+def moderate_batch(model, object_ids):
     """
-    Task to moderate the content of a post.
+    Get moderation verdicts for pending objects in micro-batches.
+
+    Returns (id, created_at, is_acceptable) tuples.
+    """
+
+    pending = list(
+        model.objects.filter(id__in=object_ids, status=Statuses.PENDING).values_list(
+            "id", "content", "created_at"
+        )
+    )
+    if not pending:
+        return []
+
+    verdicts = get_moderation_verdicts([content for _, content, _ in pending])
+    return [
+        (pk, created_at, is_acceptable)
+        for (pk, _, created_at), is_acceptable in zip(pending, verdicts)
+    ]
+
+
+def moderate_posts(post_ids):
+    """
+    Moderate several pending posts in one batch.
+
+    Returns the ids of the posts that were approved.
+    """
+
+    results = moderate_batch(Post, post_ids)
+    transitioned_ids = Post.objects.bulk_transition(
+        {pk: get_verdict_status(is_acceptable) for pk, _, is_acceptable in results}
+    )
+    approved_ids = [
+        pk
+        for pk, _, is_acceptable in results
+        if is_acceptable and pk in transitioned_ids
+    ]
+    if approved_ids:
+        invalidate_posts(approved_ids)
+        index_posts(approved_ids)
+    return approved_ids
+
+
+def moderate_comments(comment_ids):
+    """
+    Moderate several pending comments in one batch and schedule automatic
+    responses to the approved ones.
+
+    Returns the ids of the comments that were approved.
+    """
+
+    results = moderate_batch(Comment, comment_ids)
+    with transaction.atomic():
+        transitioned_ids = set(
+            Comment.objects.bulk_transition(
+                {
+                    pk: get_verdict_status(is_acceptable)
+                    for pk, _, is_acceptable in results
+                }
+            )
+        )
+        record_status_changes(
+            (created_at, Statuses.PENDING, get_verdict_status(is_acceptable))
+            for pk, created_at, is_acceptable in results
+            if pk in transitioned_ids
+        )
+
+    approved_ids = [
+        pk
+        for pk, _, is_acceptable in results
+        if is_acceptable and pk in transitioned_ids
+    ]
+    approved = list(
+        Comment.objects.filter(id__in=approved_ids).select_related("post__author")
+    )
+    invalidate_comments([comment.post_id for comment in approved])
+    index_objects(approved)
+    schedule_auto_responses(approved)
+    return approved_ids
+
+
+@shared_task(bind=True, max_retries=settings.GROQ_RATE_LIMIT_TASK_RETRIES)
+def moderate_post_content(self, post_id):
+    """
+    Task to moderate the content of a pending post.
     """
 
     try:
-        post = Post.objects.get(id=post_id)
-        is_acceptable = moderate_content(post.content)
-        if is_acceptable:
-            post.status = Statuses.APPROVED
-        else:
-            post.status = Statuses.BLOCKED
-        post.save()
+        content = (
+            Post.objects.filter(id=post_id, status=Statuses.PENDING)
+            .values_list("content", flat=True)
+            .first()
+        )
+        if content is None:
+            return
+
+        is_acceptable = get_moderation_verdict(content)
+        transitioned = Post.objects.transition(
+            post_id, get_verdict_status(is_acceptable)
+        )
+        if transitioned and is_acceptable:
+            invalidate_post(post_id)
+            index_posts([post_id])
+    except RateLimitError as e:
+        Post.objects.record_error([post_id], e)
+        raise self.retry(exc=e, countdown=get_rate_limit_countdown(e))
     except Exception as e:
         print("Error moderating post content: ", e)
+        Post.objects.record_error([post_id], e)
 
 
-@shared_task
-def moderate_comment_content(comment_id):
+@shared_task(bind=True, max_retries=settings.GROQ_RATE_LIMIT_TASK_RETRIES)
+def moderate_comment_content(self, comment_id):
     """
-    Task to moderate the content of a comment.
+    Task to moderate the content of a pending comment.
     """
 
     try:
-        comment = Comment.objects.get(id=comment_id)
-        is_acceptable = moderate_content(comment.content)
-        if is_acceptable:
-            comment.status = Statuses.APPROVED
-            comment.save()
-
-            post = comment.post
-            if post.author.auto_response_enabled and post.author != comment.author:
-                delay = post.author.auto_response_delay
-                generate_auto_response.apply_async(
-                    args=[comment.id], countdown=delay * 60
+        pending = (
+            Comment.objects.filter(id=comment_id, status=Statuses.PENDING)
+            .values("content", "created_at", "post_id")
+            .first()
+        )
+        if pending is None:
+            return
+
+        is_acceptable = get_moderation_verdict(pending["content"])
+        new_status = get_verdict_status(is_acceptable)
+        with transaction.atomic():
+            transitioned = Comment.objects.transition(comment_id, new_status)
+            if transitioned:
+                record_status_changes(
+                    [(pending["created_at"], Statuses.PENDING, new_status)]
                 )
-        else:
-            comment.status = Statuses.BLOCKED
-            comment.save()
+
+        if transitioned and is_acceptable:
+            invalidate_comments([pending["post_id"]])
+            index_comments([comment_id])
+            schedule_auto_responses(
+                Comment.objects.filter(id=comment_id).select_related("post__author")
+            )
+    except RateLimitError as e:
+        Comment.objects.record_error([comment_id], e)
+        raise self.retry(exc=e, countdown=get_rate_limit_countdown(e))
     except Exception as e:
         print("Error moderating comment content: ", e)
+        Comment.objects.record_error([comment_id], e)
+
+
+@shared_task(bind=True, max_retries=settings.GROQ_RATE_LIMIT_TASK_RETRIES)
+def moderate_posts_batch(self, post_ids):
+    """
+    Task to moderate the content of several posts in one batch.
+    """
+
+    try:
+        moderate_posts(post_ids)
+    except RateLimitError as e:
+        Post.objects.record_error(post_ids, e)
+        raise self.retry(exc=e, countdown=get_rate_limit_countdown(e))
+    except Exception as e:
+        print("Error moderating posts batch: ", e)
+        Post.objects.record_error(post_ids, e)
+
+
+@shared_task(bind=True, max_retries=settings.GROQ_RATE_LIMIT_TASK_RETRIES)
+def moderate_comments_batch(self, comment_ids):
+    """
+    Task to moderate the content of several comments in one batch.
+    """
+
+    try:
+        moderate_comments(comment_ids)
+    except RateLimitError as e:
+        Comment.objects.record_error(comment_ids, e)
+        raise self.retry(exc=e, countdown=get_rate_limit_countdown(e))
+    except Exception as e:
+        print("Error moderating comments batch: ", e)
+        Comment.objects.record_error(comment_ids, e)
+
+
+def claim_pending(model):
+    """
+    Lease up to MODERATION_BATCH_SIZE pending objects no other drain holds
+    for MODERATION_BATCH_LEASE seconds, oldest first, and return their ids.
+    Concurrent drains skip each other's rows where the database supports
+    SKIP LOCKED, and wait for each other otherwise.
+    """
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            model.objects.filter(status=Statuses.PENDING)
+            .filter(
+                Q(moderation_leased_until__isnull=True)
+                | Q(moderation_leased_until__lte=now)
+            )
+            .order_by("created_at")
+            .select_for_update(
+                skip_locked=connection.features.has_select_for_update_skip_locked
+            )
+            .values_list("id", flat=True)[: settings.MODERATION_BATCH_SIZE]
+        )
+        if ids:
+            model.objects.filter(id__in=ids).update(
+                moderation_leased_until=now
+                + timedelta(seconds=settings.MODERATION_BATCH_LEASE)
+            )
+    return ids
+
+
+@shared_task
+def drain_pending_moderation():
+    """
+    Task to drain pending posts and comments into micro-batches.
+
+    Runs every MODERATION_BATCH_INTERVAL seconds, so an item waits at most one
+    interval before it is moderated, and batches hold at most
+    MODERATION_BATCH_SIZE items. Each batch is claimed with claim_pending, so
+    overlapping runs on different workers split the pending items between
+    them. A batch that fails stays leased, so that it doesn't hold up the
+    items after it, and is left to the runs after its lease and the sweeper.
+    """
+
+    try:
+        deadline = time.monotonic() + settings.MODERATION_BATCH_MAX_DURATION
+        while time.monotonic() < deadline:
+            has_pending = False
+            for model, moderate in (
+                (Post, moderate_posts),
+                (Comment, moderate_comments),
+            ):
+                pending_ids = claim_pending(model)
+                if not pending_ids:
+                    continue
+                has_pending = True
+                try:
+                    moderate(pending_ids)
+                except RateLimitError:
+                    # Release the batch for the next run, which waits for the
+                    # rate limiter.
+                    model.objects.filter(id__in=pending_ids).update(
+                        moderation_leased_until=None
+                    )
+                    raise
+                except Exception as e:
+                    print("Error draining moderation batch: ", e)
+                    model.objects.record_error(pending_ids, e)
+            if not has_pending:
+                break
+    except RateLimitError as e:
+        print("Moderation drain paused by rate limit: ", e)
+
+
+def enqueue_moderation(model, ids):
+    """
+    Enqueue the moderation of objects in batches of MODERATION_BATCH_SIZE,
+    behind the moderation of fresh content.
+    """
+
+    moderate_task = moderate_posts_batch if model is Post else moderate_comments_batch
+    for start in range(0, len(ids), settings.MODERATION_BATCH_SIZE):
+        moderate_task.apply_async(
+            args=[ids[start : start + settings.MODERATION_BATCH_SIZE]],
+            priority=settings.MODERATION_RETRY_PRIORITY,
+        )
+
+
+def sweep_stale_pending(model):
+    """
+    Re-enqueue objects pending for longer than MODERATION_STALE_AFTER seconds,
+    and move those that used up MODERATION_MAX_ATTEMPTS to the failed status.
+
+    Returns the numbers of re-enqueued and failed objects.
+    """
+
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.MODERATION_STALE_AFTER)
+    stale = list(
+        model.objects.filter(status=Statuses.PENDING, updated_at__lt=cutoff)
+        .order_by("updated_at")
+        .values_list("id", "created_at", "moderation_attempts")[
+            : settings.MODERATION_SWEEP_LIMIT
+        ]
+    )
+
+    exhausted = {
+        pk: created_at
+        for pk, created_at, attempts in stale
+        if attempts >= settings.MODERATION_MAX_ATTEMPTS
+    }
+    retry_ids = [pk for pk, _, _ in stale if pk not in exhausted]
+
+    with transaction.atomic():
+        failed_ids = model.objects.bulk_transition(
+            dict.fromkeys(exhausted, Statuses.FAILED)
+        )
+        if model is Comment:
+            record_status_changes(
+                (exhausted[pk], Statuses.PENDING, Statuses.FAILED) for pk in failed_ids
+            )
+
+        # Bumping updated_at gives the task MODERATION_STALE_AFTER seconds to
+        # finish before the object is swept again.
+        model.objects.filter(id__in=retry_ids, status=Statuses.PENDING).update(
+            moderation_attempts=F("moderation_attempts") + 1, updated_at=now
+        )
+
+    enqueue_moderation(model, retry_ids)
+    return len(retry_ids), len(failed_ids)
+
+
+@shared_task
+def sweep_stuck_moderation():
+    """
+    Task to recover posts and comments left pending by failed or lost
+    moderation tasks.
+    """
+
+    for model in (Post, Comment):
+        try:
+            requeued, failed = sweep_stale_pending(model)
+            if requeued or failed:
+                print(
+                    f"Swept stale pending {model._meta.verbose_name_plural}: "
+                    f"{requeued} re-enqueued, {failed} failed"
+                )
+        except Exception as e:
+            print("Error sweeping stuck moderation: ", e)
+
+
+def requeue_failed(model, ids):
+    """
+    Move failed objects back to pending with fresh attempts and enqueue their
+    moderation. Returns the ids of the requeued objects.
+    """
+
+    with transaction.atomic():
+        requeued_ids = model.objects.bulk_transition(
+            dict.fromkeys(ids, Statuses.PENDING), from_status=Statuses.FAILED
+        )
+        model.objects.filter(id__in=requeued_ids).update(
+            moderation_attempts=0, moderation_error=""
+        )
+        if model is Comment:
+            record_status_changes(
+                (created_at, Statuses.FAILED, Statuses.PENDING)
+                for created_at in Comment.objects.filter(
+                    id__in=requeued_ids
+                ).values_list("created_at", flat=True)
+            )
+
+    enqueue_moderation(model, requeued_ids)
+    return requeued_ids
 
 
 @shared_task
-def generate_auto_response(comment_id):
+def dispatch_auto_responses():
+    """
+    Task to enqueue the generation of due automatic responses in batches.
+
+    Runs every AUTO_RESPONSE_DISPATCH_INTERVAL seconds. Dispatched rows are
+    leased for AUTO_RESPONSE_LEASE seconds rather than deleted, so responses
+    lost with a worker are dispatched again; generate_auto_responses deletes
+    them. Concurrent dispatchers skip each other's rows where the database
+    supports SKIP LOCKED.
+    """
+
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=settings.AUTO_RESPONSE_LEASE)
+    dispatched = 0
+    while dispatched < settings.AUTO_RESPONSE_DISPATCH_LIMIT:
+        with transaction.atomic():
+            comment_ids = list(
+                ScheduledAutoResponse.objects.filter(due_at__lte=now)
+                .order_by("due_at")
+                .select_for_update(
+                    skip_locked=connection.features.has_select_for_update_skip_locked
+                )
+                .values_list("comment_id", flat=True)[
+                    : settings.AUTO_RESPONSE_DISPATCH_BATCH_SIZE
+                ]
+            )
+            if not comment_ids:
+                break
+            ScheduledAutoResponse.objects.filter(comment_id__in=comment_ids).update(
+                due_at=lease_until
+            )
+            transaction.on_commit(partial(generate_auto_responses.delay, comment_ids))
+        dispatched += len(comment_ids)
+    return dispatched
+
+
+@shared_task(bind=True, max_retries=settings.GROQ_RATE_LIMIT_TASK_RETRIES)
+def generate_auto_response(self, comment_id):
     """
     Task to generate an automatic response to a comment.
+
+    Kept for responses scheduled with a countdown before the database
+    scheduler; new responses go through dispatch_auto_responses.
     """
 
     try:
@@ -66,5 +476,64 @@ def generate_auto_response(comment_id):
         Comment.objects.create(
             post=post, author=author, content=response_content, status=Statuses.APPROVED
         )
+        invalidate_comments([post.id])
+    except RateLimitError as e:
+        raise self.retry(exc=e, countdown=get_rate_limit_countdown(e))
     except Exception as e:
         print("Error generating auto response: ", e)
+
+
+@shared_task
+def generate_auto_responses(comment_ids):
+    """
+    Task to generate automatic responses to several comments concurrently.
+
+    Removes the comments from the schedule, except those whose response was
+    rate-limited, which are due again after the Retry-After delay.
+    """
+
+    try:
+        comments = list(
+            Comment.objects.filter(
+                id__in=comment_ids, status=Statuses.APPROVED
+            ).select_related("post__author")
+        )
+        responses = run_async(
+            agenerate_responses(
+                [(comment.post.content, comment.content) for comment in comments]
+            )
+        )
+
+        new_comments = []
+        rate_limited = {}
+        for comment, response_content in zip(comments, responses):
+            if isinstance(response_content, RateLimitError):
+                rate_limited[comment.id] = response_content
+                continue
+            if isinstance(response_content, Exception):
+                print("Error generating auto response: ", response_content)
+                continue
+            new_comments.append(
+                Comment(
+                    post=comment.post,
+                    author=comment.post.author,
+                    content=response_content,
+                    status=Statuses.APPROVED,
+                )
+            )
+        with transaction.atomic():
+            Comment.objects.bulk_create(new_comments)
+            record_comments_created(new_comments)
+            # bulk_create doesn't send post_save, which indexes new content.
+            index_objects(new_comments)
+            invalidate_comments([comment.post_id for comment in new_comments])
+            ScheduledAutoResponse.objects.filter(comment_id__in=comment_ids).exclude(
+                comment_id__in=rate_limited
+            ).delete()
+            if rate_limited:
+                countdown = get_rate_limit_countdown(next(iter(rate_limited.values())))
+                ScheduledAutoResponse.objects.filter(
+                    comment_id__in=rate_limited
+                ).update(due_at=timezone.now() + timedelta(seconds=countdown))
+    except Exception as e:
+        print("Error generating auto responses: ", e)
@@ -2,22 +2,32 @@ from django.urls import path
 
 from .views import (
     PostListCreateView,
+    PostBulkCreateView,
     PostDetailView,
     CommentListCreateView,
+    CommentBulkCreateView,
     CommentDetailView,
     CommentsDailyBreakdownView,
+    SearchView,
 )
 
 
 urlpatterns = [
     path("posts/", PostListCreateView.as_view(), name="post_list_create"),
+    path("posts/bulk/", PostBulkCreateView.as_view(), name="post_bulk_create"),
     path("posts/<int:pk>/", PostDetailView.as_view(), name="post_detail"),
     path(
         "posts/<int:post_id>/comments/",
         CommentListCreateView.as_view(),
         name="comment_list_create",
     ),
+    path(
+        "posts/<int:post_id>/comments/bulk/",
+        CommentBulkCreateView.as_view(),
+        name="comment_bulk_create",
+    ),
     path("comments/<int:pk>/", CommentDetailView.as_view(), name="comment_detail"),
+    path("search/", SearchView.as_view(), name="search"),
     path(
         "analytics/comments-daily-breakdown/",
         CommentsDailyBreakdownView.as_view(),
@@ -0,0 +1,226 @@
+import fnmatch
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+
+# Bump when the moderation prompt changes so stale verdicts are not reused.
+PROMPT_VERSION = 1
+
+STATS_KEYS = ("local_hits", "shared_hits", "misses")
+
+# Backends keeping their entries inside each process.
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+DELETE_BATCH_SIZE = 1000
+
+
+def normalize_content(content):
+    """
+    Normalize content so that trivially different copies share a verdict.
+    """
+
+    content = unicodedata.normalize("NFKC", content).casefold()
+    return " ".join(content.split())
+
+
+def content_hash(content):
+    """
+    Return the hash of the normalized content used as the cache key.
+    """
+
+    normalized = normalize_content(content).encode("utf-8")
+    return hashlib.sha256(normalized).hexdigest()
+
+
+def increment_shared_counter(name, cache_alias="moderation"):
+    """
+    Increment a counter kept in the shared cache, visible to all workers.
+    """
+
+    shared = caches[cache_alias]
+    key = f"stats:{name}"
+    try:
+        shared.incr(key)
+    except ValueError:
+        shared.add(key, 0, timeout=None)
+        try:
+            shared.incr(key)
+        except ValueError:
+            # The backend stores nothing, like the dummy cache.
+            pass
+
+
+def is_shared_cache(cache_alias):
+    """
+    Return whether a cache is shared by all processes rather than kept in
+    each one.
+    """
+
+    return settings.CACHES[cache_alias]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def delete_matching(cache, pattern):
+    """
+    Delete the keys of a cache matching a glob pattern, leaving the other
+    keys of the backend alone. Supports the Redis and local-memory backends.
+    """
+
+    full_pattern = cache.make_key(pattern)
+    if isinstance(cache, RedisCache):
+        client = cache._cache.get_client(write=True)
+        keys = []
+        for key in client.scan_iter(match=full_pattern, count=DELETE_BATCH_SIZE):
+            keys.append(key)
+            if len(keys) == DELETE_BATCH_SIZE:
+                client.delete(*keys)
+                keys = []
+        if keys:
+            client.delete(*keys)
+    elif isinstance(cache, LocMemCache):
+        with cache._lock:
+            for key in [
+                key for key in cache._cache if fnmatch.fnmatchcase(key, full_pattern)
+            ]:
+                cache._delete(key)
+
+
+def get_shared_counters(names, cache_alias="moderation"):
+    """
+    Return the values of counters kept in the shared cache.
+    """
+
+    values = caches[cache_alias].get_many([f"stats:{name}" for name in names])
+    return {name: values.get(f"stats:{name}", 0) for name in names}
+
+
+def get_counter_stats(local_stats, names):
+    """
+    Return counters of this process, and of all workers when the moderation
+    cache is shared. With a per-process backend the cached counters only
+    count this process, so they aren't reported as cluster-wide.
+    """
+
+    stats = {"process": local_stats}
+    if is_shared_cache("moderation"):
+        stats["cluster"] = get_shared_counters(names)
+    return stats
+
+
+class VerdictCache:
+    """
+    Two-tier cache of moderation verdicts keyed by the normalized content hash.
+
+    The first tier is an in-process LRU, the second tier is a shared Django
+    cache backend, so duplicate content is judged once per TTL across workers.
+    """
+
+    def __init__(self, cache_alias, ttl, local_size):
+        self.cache_alias = cache_alias
+        self.ttl = ttl
+        self.local_size = local_size
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(STATS_KEYS, 0)
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    def _key(self, digest):
+        return f"moderation:verdict:v{PROMPT_VERSION}:{digest}"
+
+    def _get_local(self, digest):
+        with self._lock:
+            entry = self._local.get(digest)
+            if entry is None:
+                return None
+            verdict, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._local[digest]
+                return None
+            self._local.move_to_end(digest)
+            return verdict
+
+    def _set_local(self, digest, verdict):
+        with self._lock:
+            self._local[digest] = (verdict, time.monotonic() + self.ttl)
+            self._local.move_to_end(digest)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _record(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+        increment_shared_counter(stat)
+
+    def get(self, content):
+        """
+        Return the cached verdict for the content, or None on a miss.
+        """
+
+        digest = content_hash(content)
+
+        verdict = self._get_local(digest)
+        if verdict is not None:
+            self._record("local_hits")
+            return verdict
+
+        verdict = self.shared.get(self._key(digest))
+        if verdict is not None:
+            self._set_local(digest, verdict)
+            self._record("shared_hits")
+            return verdict
+
+        self._record("misses")
+        return None
+
+    def set(self, content, verdict):
+        """
+        Store the verdict for the content in both tiers.
+        """
+
+        digest = content_hash(content)
+        self._set_local(digest, verdict)
+        self.shared.set(self._key(digest), verdict, timeout=self.ttl)
+
+    def stats(self):
+        """
+        Return hit/miss counters of this process, and of all workers when
+        the second tier is a shared backend.
+        """
+
+        with self._lock:
+            local_stats = dict(self._stats)
+        return get_counter_stats(local_stats, STATS_KEYS)
+
+    def clear(self):
+        """
+        Drop all cached verdicts and their counters.
+
+        Only the verdict and counter keys are deleted, since the shared tier
+        often lives in the same Redis database as the Celery broker.
+        """
+
+        with self._lock:
+            self._local.clear()
+            self._stats = dict.fromkeys(STATS_KEYS, 0)
+        delete_matching(self.shared, "moderation:verdict:*")
+        self.shared.delete_many([f"stats:{name}" for name in STATS_KEYS])
+
+
+verdict_cache = VerdictCache(
+    cache_alias="moderation",
+    ttl=settings.MODERATION_CACHE_TTL,
+    local_size=settings.MODERATION_CACHE_LOCAL_SIZE,
+)
@@ -1,57 +1,184 @@
-from django.db.models.functions import TruncDate
-from django.db.models import Count, Q
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden
+from django.shortcuts import get_object_or_404
 from django.utils.dateparse import parse_date
 from rest_framework import generics, permissions, status
 from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from posts_ai_api.db_routing import ReplicaReadMixin
+from posts_ai_api.profiling import timed
 
-from .models import Post, Comment, Statuses
-from .serializers import PostSerializer, CommentSerializer
+from .analytics import record_comments_created
+from .bulk import BulkCreateView
+from .conditional import ConditionalGetMixin
+from .metrics import get_registry, is_metrics_client
+from .models import Post, Comment, CommentDailyStats, Statuses
+from .renderers import ORJSONRenderer
+from .search import KIND_FILTERS, SearchResults
+from .serializers import (
+    PostSerializer,
+    CommentSerializer,
+    SearchResultSerializer,
+    ValuesSerializer,
+)
 from .permissions import IsAuthorOrReadOnly
-from .tasks import moderate_post_content, moderate_comment_content
+from .pagination import PostPagination, CommentPagination, SearchPagination
+from .response_cache import (
+    CachedResponseMixin,
+    POSTS_SCOPE,
+    get_post_scope,
+    get_comments_scope,
+    invalidate_post,
+    invalidate_comments,
+)
+from .tasks import (
+    moderate_post_content,
+    moderate_comment_content,
+    moderate_posts_batch,
+    moderate_comments_batch,
+)
+
+
+class ValuesListMixin:
+    """
+    Mixin listing objects from values() rows turned into plain dicts by a
+    ValuesSerializer, with the same output as the serializer_class, and
+    rendering them with orjson. Writes still go through the serializer_class.
+    """
+
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    values_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.values_serializer.get_values(
+            self.filter_queryset(self.get_queryset())
+        )
+        rows = self.paginate_queryset(queryset)
+        if rows is None:
+            rows = queryset
+        with timed("serialize"):
+            data = self.values_serializer.to_representation(rows)
+        if self.paginator is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
 
 @extend_schema(
     description="Retrieve a list of posts or create a new post.",
     responses={200: PostSerializer(many=True)},
 )
-class PostListCreateView(generics.ListCreateAPIView):
+class PostListCreateView(
+    ReplicaReadMixin,
+    CachedResponseMixin,
+    ValuesListMixin,
+    generics.ListCreateAPIView,
+):
     """
     View to retrieve a list of posts or create a new post.
     """
 
     serializer_class = PostSerializer
+    values_serializer = ValuesSerializer(PostSerializer)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    queryset = Post.objects.filter(status=Statuses.APPROVED)
+    pagination_class = PostPagination
+    queryset = Post.objects.filter(status=Statuses.APPROVED).select_related("author")
+
+    def get_cache_scopes(self):
+        return [POSTS_SCOPE]
 
     def perform_create(self, serializer):
         post = serializer.save(author=self.request.user, status=Statuses.PENDING)
-        moderate_post_content.delay(post.id)
+        if not settings.MODERATION_BATCH_ENABLED:
+            moderate_post_content.delay(post.id)
+
+
+@extend_schema(
+    description=(
+        "Create a list of posts. Valid items are created and invalid ones are "
+        "reported by their index."
+    ),
+    request=PostSerializer(many=True),
+    responses={201: PostSerializer(many=True)},
+)
+class PostBulkCreateView(BulkCreateView):
+    """
+    View to create many posts in one request.
+    """
+
+    serializer_class = PostSerializer
+
+    def build_object(self, validated_data):
+        return Post(**validated_data, author=self.request.user, status=Statuses.PENDING)
+
+    def perform_bulk_create(self, posts):
+        posts = Post.objects.bulk_create(posts)
+        if not settings.MODERATION_BATCH_ENABLED:
+            transaction.on_commit(
+                partial(moderate_posts_batch.delay, [post.id for post in posts])
+            )
+        return posts
 
 
 @extend_schema(
     description="Retrieve, update, or delete a specific post.",
     responses={200: PostSerializer},
 )
-class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PostDetailView(
+    ReplicaReadMixin,
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    generics.RetrieveUpdateDestroyAPIView,
+):
     """
     View to retrieve, update, or delete a specific post.
     """
 
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    queryset = Post.objects.filter(status=Statuses.APPROVED)
+    queryset = Post.objects.filter(status=Statuses.APPROVED).select_related("author")
 
+    def get_cache_scopes(self):
+        return [get_post_scope(self.kwargs["pk"])]
 
-class CommentListCreateView(generics.ListCreateAPIView):
+    def get_object(self):
+        post = super().get_object()
+        self.last_modified = post.updated_at
+        return post
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        invalidate_post(post.id)
+
+    def perform_destroy(self, instance):
+        post_id = instance.id
+        instance.delete()
+        invalidate_post(post_id)
+        invalidate_comments([post_id])
+
+
+class CommentListCreateView(
+    ReplicaReadMixin,
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    ValuesListMixin,
+    generics.ListCreateAPIView,
+):
     """
     View to retrieve a list of comments for a post or create a new comment.
     """
 
     serializer_class = CommentSerializer
+    values_serializer = ValuesSerializer(CommentSerializer)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CommentPagination
 
     @extend_schema(
         description="Retrieve a list of comments for a post or create a new comment.",
@@ -59,35 +186,137 @@ class CommentListCreateView(generics.ListCreateAPIView):
     )
     def get_queryset(self):
         post_id = self.kwargs["post_id"]
-        return Comment.objects.filter(post_id=post_id, status=Statuses.APPROVED)
+        return Comment.objects.filter(
+            post_id=post_id, status=Statuses.APPROVED
+        ).select_related("author")
+
+    def get_cache_scopes(self):
+        return [get_comments_scope(self.kwargs["post_id"])]
 
     def perform_create(self, serializer):
         post = Post.objects.get(pk=self.kwargs["post_id"])
         if post.status != Statuses.APPROVED:
             raise ValidationError("You can't comment on a post that is not approved.")
 
-        comment = serializer.save(
-            author=self.request.user, post=post, status=Statuses.PENDING
+        with transaction.atomic():
+            comment = serializer.save(
+                author=self.request.user, post=post, status=Statuses.PENDING
+            )
+
+        if not settings.MODERATION_BATCH_ENABLED:
+            moderate_comment_content.delay(comment.id)
+
+
+@extend_schema(
+    description=(
+        "Create a list of comments on a post. Valid items are created and "
+        "invalid ones are reported by their index."
+    ),
+    request=CommentSerializer(many=True),
+    responses={201: CommentSerializer(many=True)},
+)
+class CommentBulkCreateView(BulkCreateView):
+    """
+    View to create many comments on a post in one request.
+    """
+
+    serializer_class = CommentSerializer
+
+    def post(self, request, *args, **kwargs):
+        self.post_object = get_object_or_404(Post, pk=self.kwargs["post_id"])
+        if self.post_object.status != Statuses.APPROVED:
+            raise ValidationError("You can't comment on a post that is not approved.")
+        return super().post(request, *args, **kwargs)
+
+    def build_object(self, validated_data):
+        return Comment(
+            **validated_data,
+            author=self.request.user,
+            post=self.post_object,
+            status=Statuses.PENDING,
         )
 
-        moderate_comment_content.delay(comment.id)
+    def perform_bulk_create(self, comments):
+        comments = Comment.objects.bulk_create(comments)
+        # bulk_create doesn't send the post_save signal counting comments.
+        record_comments_created(comments)
+        if not settings.MODERATION_BATCH_ENABLED:
+            transaction.on_commit(
+                partial(
+                    moderate_comments_batch.delay,
+                    [comment.id for comment in comments],
+                )
+            )
+        return comments
 
 
 @extend_schema(
     description="Retrieve, update, or delete a specific comment.",
     responses={200: CommentSerializer},
 )
-class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CommentDetailView(ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     View to retrieve, update, or delete a specific comment.
     """
 
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    queryset = Comment.objects.filter(status=Statuses.APPROVED)
+    queryset = Comment.objects.filter(status=Statuses.APPROVED).select_related("author")
+
+    def perform_update(self, serializer):
+        comment = serializer.save()
+        invalidate_comments([comment.post_id])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_comments([instance.post_id])
+
+
+class SearchView(ReplicaReadMixin, generics.ListAPIView):
+    """
+    View to search approved posts and comments.
+    """
+
+    serializer_class = SearchResultSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = SearchPagination
+
+    @extend_schema(
+        description=(
+            "Search approved posts and comments with the full-text index, best "
+            "matches first."
+        ),
+        parameters=[
+            OpenApiParameter(
+                "q",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                description="Words to search for.",
+                required=True,
+            ),
+            OpenApiParameter(
+                "type",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                description="Only search posts or comments.",
+                enum=["post", "comment"],
+            ),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
+    def get_queryset(self):
+        query = self.request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+        kind = self.request.query_params.get("type") or None
+        if kind not in KIND_FILTERS:
+            raise ValidationError({"type": "Must be post or comment."})
+        return SearchResults(query, kind)
 
-class CommentsDailyBreakdownView(APIView):
+
+class CommentsDailyBreakdownView(ReplicaReadMixin, APIView):
     """
     View to retrieve daily breakdown of comments within a date range.
     """
@@ -140,29 +369,32 @@ class CommentsDailyBreakdownView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        comments = Comment.objects.filter(
-            created_at__date__gte=date_from_parsed,
-            created_at__date__lte=date_to_parsed,
-        )
-
-        daily_stats = (
-            comments.annotate(date=TruncDate("created_at"))
-            .values("date")
-            .annotate(
-                total_comments=Count("id"),
-                blocked_comments=Count("id", filter=Q(status=Statuses.BLOCKED)),
-            )
-            .order_by("date")
-        )
+        daily_stats = CommentDailyStats.objects.filter(
+            date__gte=date_from_parsed,
+            date__lte=date_to_parsed,
+            total_comments__gt=0,
+        ).order_by("date")
 
         result = []
         for entry in daily_stats:
             result.append(
                 {
-                    "date": entry["date"],
-                    "total_comments": entry["total_comments"],
-                    "blocked_comments": entry["blocked_comments"],
+                    "date": entry.date,
+                    "total_comments": entry.total_comments,
+                    "blocked_comments": entry.blocked_comments,
                 }
             )
 
         return Response(result, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    """
+    View exposing the metrics of the moderation pipeline to Prometheus.
+    """
+
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
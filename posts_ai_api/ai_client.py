@@ -1,7 +1,95 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
 from django.conf import settings
-from groq import Groq
+from groq import AsyncGroq, DefaultAsyncHttpxClient, DefaultHttpxClient, Groq
+
+
+def get_connection_limits():
+    """
+    Connection pool limits shared by the sync and async clients.
+    """
+
+    return httpx.Limits(
+        max_connections=settings.GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.GROQ_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.GROQ_KEEPALIVE_EXPIRY,
+    )
 
 
 client = Groq(
     api_key=settings.GROQ_API_KEY,
+    timeout=settings.GROQ_TIMEOUT,
+    max_retries=0,
+    http_client=DefaultHttpxClient(limits=get_connection_limits()),
 )
+
+
+# Event loop of each thread, kept open between run_async calls.
+_thread_loops = threading.local()
+
+# Async client of each event loop, dropped along with the loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def create_async_client():
+    """
+    Create an async GROQ client with its own keep-alive connection pool.
+
+    The client is bound to the event loop it is first used on. Like the sync
+    client, it doesn't retry by itself: retries go through the rate limiter.
+    """
+
+    return AsyncGroq(
+        api_key=settings.GROQ_API_KEY,
+        timeout=settings.GROQ_TIMEOUT,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=get_connection_limits()),
+    )
+
+
+def get_async_client():
+    """
+    Return the async GROQ client of the running event loop, creating it on
+    first use, so that its keep-alive connections outlive one coroutine.
+    """
+
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = _async_clients[loop] = create_async_client()
+    return async_client
+
+
+def run_async(coroutine):
+    """
+    Run a coroutine to completion from sync code, like asyncio.run, but on an
+    event loop kept open for the calling thread, so that every Celery task a
+    worker process runs shares one async client and connection pool.
+    """
+
+    loop = getattr(_thread_loops, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _thread_loops.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coroutine)
+
+
+async def gather_bounded(coroutines, limit=None):
+    """
+    Run coroutines concurrently with at most limit of them in flight.
+
+    Results are returned in order; exceptions are returned instead of raised
+    so that one failed call doesn't cancel the others.
+    """
+
+    semaphore = asyncio.Semaphore(limit or settings.GROQ_MAX_CONCURRENCY)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(
+        *(run(coroutine) for coroutine in coroutines), return_exceptions=True
+    )
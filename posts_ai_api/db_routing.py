@@ -0,0 +1,120 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Whether the reads of the request being handled may go to a replica.
+replica_reads = ContextVar("replica_reads", default=False)
+
+
+def get_primary_pin_key(user_id):
+    return f"db:primary_pin:{user_id}"
+
+
+def pin_to_primary(user):
+    """
+    Keep the reads of a user who just wrote on the primary for
+    DATABASE_PRIMARY_PIN_SECONDS, so that they read their own writes despite
+    the replication lag.
+    """
+
+    cache.set(
+        get_primary_pin_key(user.pk), True, settings.DATABASE_PRIMARY_PIN_SECONDS
+    )
+
+
+def is_pinned_to_primary(user):
+    return (
+        user.is_authenticated
+        and cache.get(get_primary_pin_key(user.pk)) is not None
+    )
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the reads of the block to the primary.
+    """
+
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Router sending reads to a random DATABASE_READ_REPLICAS alias while
+    ReplicaReadMixin allows it, and everything else to the primary.
+
+    Celery tasks, management commands and writes always use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if replica_reads.get() and settings.DATABASE_READ_REPLICAS:
+            return random.choice(settings.DATABASE_READ_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaReadMixin:
+    """
+    Mixin letting safe-method requests to an API view read from the replicas,
+    unless the user is pinned to the primary.
+
+    The pin is checked once the request is authenticated, so that it covers
+    token clients, which usually don't keep cookies.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.DATABASE_READ_REPLICAS
+            and request.method in SAFE_METHODS
+            and not is_pinned_to_primary(request.user)
+        ):
+            replica_reads.set(True)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware scoping the replica reads allowed by ReplicaReadMixin to one
+    request, and pinning users to the primary after a successful write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replica_reads.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+
+        # API views set the user they authenticated on the request.
+        user = getattr(request, "user", None)
+        if (
+            settings.DATABASE_READ_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        ):
+            pin_to_primary(user)
+        return response
@@ -0,0 +1,215 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework import serializers
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+logger = logging.getLogger(__name__)
+
+# Profile of the request being handled, None when it isn't profiled.
+current_profile = ContextVar("current_profile", default=None)
+
+# Returned by timed() for requests that aren't profiled, so that timing a
+# section costs a context variable lookup.
+NOT_TIMED = nullcontext()
+
+
+class RequestProfile:
+    """
+    Time spent by one request in each section, and its SQL queries.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.queries = 0
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, duration):
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        self.queries += 1
+        with self.timer("db"):
+            return execute(sql, params, many, context)
+
+    def get_server_timing(self):
+        """
+        Return the durations in the Server-Timing header format.
+        """
+
+        metrics = []
+        for name, duration in self.durations.items():
+            metric = f"{name};dur={duration * 1000:.1f}"
+            if name == "db":
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+
+def timed(name):
+    """
+    Time a section of the request being profiled, if any.
+    """
+
+    profile = current_profile.get()
+    if profile is None:
+        return NOT_TIMED
+    return profile.timer(name)
+
+
+def is_profiled(request):
+    """
+    Profile requests asking for it with the X-Profile header, when allowed by
+    PROFILING_HEADER_ENABLED, and a PROFILING_SAMPLE_RATE fraction of all
+    requests.
+    """
+
+    if settings.PROFILING_HEADER_ENABLED and "X-Profile" in request.headers:
+        return True
+    return (
+        settings.PROFILING_SAMPLE_RATE > 0
+        and random.random() < settings.PROFILING_SAMPLE_RATE
+    )
+
+
+def get_dump_path(request):
+    name = re.sub(r"[^\w]+", "-", request.path).strip("-") or "root"
+    filename = f"{time.time_ns()}-{request.method}-{name}.prof"
+    return os.path.join(settings.PROFILING_DUMP_DIR, filename)
+
+
+class ProfilingMiddleware:
+    """
+    Middleware breaking down the time of profiled requests into SQL,
+    authentication, serialization, view and rendering time.
+
+    The breakdown is sent in the Server-Timing response header and logged as
+    a JSON line. With PROFILING_DUMP_DIR set, a cProfile dump of each profiled
+    request is written there. Requests that aren't profiled pay one check.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_profiled(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        profiler = cProfile.Profile() if settings.PROFILING_DUMP_DIR else None
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute_wrapper)
+                    )
+                if profiler is not None:
+                    stack.enter_context(profiler)
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        end = time.perf_counter()
+        if "view" not in profile.durations and hasattr(request, "profile_view_start"):
+            # Responses that aren't rendered skip process_template_response.
+            profile.add("view", end - request.profile_view_start)
+        profile.add("total", end - start)
+
+        response["Server-Timing"] = profile.get_server_timing()
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "queries": profile.queries,
+                    **{
+                        f"{name}_ms": round(duration * 1000, 2)
+                        for name, duration in profile.durations.items()
+                    },
+                }
+            )
+        )
+        if profiler is not None:
+            os.makedirs(settings.PROFILING_DUMP_DIR, exist_ok=True)
+            profiler.dump_stats(get_dump_path(request))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = current_profile.get()
+        if profile is not None:
+            request.profile_view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        profile = current_profile.get()
+        if profile is None or not hasattr(request, "profile_view_start"):
+            return response
+
+        render_start = time.perf_counter()
+        profile.add("view", render_start - request.profile_view_start)
+        response.add_post_render_callback(
+            lambda response: profile.add("render", time.perf_counter() - render_start)
+        )
+        return response
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication timed in the profile of the request.
+    """
+
+    def authenticate(self, request):
+        with timed("auth"):
+            return super().authenticate(request)
+
+
+class TimedJWTScheme(SimpleJWTScheme):
+    """
+    Document TimedJWTAuthentication like the JWT authentication it times.
+    """
+
+    target_class = TimedJWTAuthentication
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    List serializer timing the serialization of its data in the profile of
+    the request.
+    """
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Mixin timing the serialization of its data in the profile of the
+    request. Serializers set TimedListSerializer as their
+    list_serializer_class to time lists too.
+    """
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            return super().data
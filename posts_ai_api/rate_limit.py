@@ -0,0 +1,345 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import redis
+from django.conf import settings
+from groq import APIConnectionError, InternalServerError, RateLimitError
+
+
+# The rate never drops below this fraction of the configured limit.
+MIN_RATE_FRACTION = 0.1
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+# Refills the bucket, lets the rate recover linearly since the last call and
+# takes a token. Returns the number of seconds to wait, 0 when a token was
+# taken. Uses the Redis clock so that workers on different hosts agree.
+ACQUIRE_SCRIPT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local recovery = tonumber(ARGV[4])
+
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts", "rate", "blocked_until")
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local rate = tonumber(state[3]) or max_rate
+local blocked_until = tonumber(state[4]) or 0
+
+local elapsed = math.max(0, now - ts)
+rate = math.max(min_rate, math.min(max_rate, rate + recovery * elapsed))
+tokens = math.min(burst, tokens + rate * elapsed)
+
+local wait = 0
+if now < blocked_until then
+    wait = blocked_until - now
+elseif tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tokens, "ts", now, "rate", rate, "blocked_until", blocked_until)
+redis.call("EXPIRE", KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Empties the bucket, blocks it for retry_after seconds and cuts the rate,
+# unless the bucket is already blocked, so that the many 429s caused by one
+# overload cut the rate once.
+PENALIZE_SCRIPT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local factor = tonumber(ARGV[3])
+local retry_after = tonumber(ARGV[4])
+
+local state = redis.call("HMGET", KEYS[1], "rate", "blocked_until")
+local rate = tonumber(state[1]) or max_rate
+local blocked_until = tonumber(state[2]) or 0
+
+if now >= blocked_until then
+    rate = math.max(min_rate, rate * factor)
+end
+blocked_until = math.max(blocked_until, now + retry_after)
+
+redis.call("HSET", KEYS[1], "tokens", 0, "ts", now, "rate", rate, "blocked_until", blocked_until)
+redis.call("EXPIRE", KEYS[1], 3600)
+return tostring(rate)
+"""
+
+
+class LocalTokenBucket:
+    """
+    In-process token bucket, used when no Redis URL is configured.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self, now, max_rate, burst):
+        if self._state is None:
+            self._state = {
+                "tokens": burst,
+                "ts": now,
+                "rate": max_rate,
+                "blocked_until": 0,
+            }
+        return self._state
+
+    def acquire(self, max_rate, min_rate, burst, recovery):
+        with self._lock:
+            now = time.monotonic()
+            state = self._load(now, max_rate, burst)
+            elapsed = max(0, now - state["ts"])
+            state["rate"] = max(
+                min_rate, min(max_rate, state["rate"] + recovery * elapsed)
+            )
+            state["tokens"] = min(burst, state["tokens"] + state["rate"] * elapsed)
+            state["ts"] = now
+
+            if now < state["blocked_until"]:
+                return state["blocked_until"] - now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0
+            return (1 - state["tokens"]) / state["rate"]
+
+    def penalize(self, max_rate, min_rate, factor, retry_after):
+        with self._lock:
+            now = time.monotonic()
+            state = self._load(now, max_rate, 0)
+            if now >= state["blocked_until"]:
+                state["rate"] = max(min_rate, state["rate"] * factor)
+            state["blocked_until"] = max(state["blocked_until"], now + retry_after)
+            state["tokens"] = 0
+            state["ts"] = now
+            return state["rate"]
+
+    def reset(self):
+        with self._lock:
+            self._state = None
+
+
+class RedisTokenBucket:
+    """
+    Token bucket kept in Redis and shared by all workers.
+    """
+
+    def __init__(self, url, key):
+        self.key = key
+        self.redis = redis.Redis.from_url(url)
+        self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+        self._penalize = self.redis.register_script(PENALIZE_SCRIPT)
+
+    def acquire(self, max_rate, min_rate, burst, recovery):
+        return float(
+            self._acquire(keys=[self.key], args=[max_rate, min_rate, burst, recovery])
+        )
+
+    def penalize(self, max_rate, min_rate, factor, retry_after):
+        return float(
+            self._penalize(
+                keys=[self.key], args=[max_rate, min_rate, factor, retry_after]
+            )
+        )
+
+    def reset(self):
+        self.redis.delete(self.key)
+
+
+def get_retry_after(error):
+    """
+    Return the delay asked for by the Retry-After headers of a failed
+    response, in seconds, or None if there is none.
+    """
+
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    try:
+        return float(headers["retry-after-ms"]) / 1000
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+
+    retry_date = email.utils.parsedate_tz(retry_after)
+    if retry_date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(retry_date) - time.time())
+
+
+def get_backoff(attempt):
+    """
+    Return the exponential backoff with full jitter before a retry.
+    """
+
+    delay = settings.GROQ_RETRY_BACKOFF * 2**attempt
+    return random.uniform(0, min(delay, settings.GROQ_RETRY_BACKOFF_MAX))
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter with adaptive backoff for GROQ API calls.
+
+    All workers take tokens from one bucket kept in Redis, so their aggregate
+    request rate stays at GROQ_RATE_LIMIT_RPM. A 429 response blocks the bucket
+    for the Retry-After delay and multiplies the rate by
+    GROQ_RATE_LIMIT_BACKOFF_FACTOR, then the rate recovers linearly over
+    GROQ_RATE_LIMIT_RECOVERY_TIME seconds (AIMD). Without a Redis URL the
+    bucket is kept in process memory.
+    """
+
+    def __init__(self, redis_url=None, key="groq:ratelimit"):
+        self.redis_url = redis_url
+        self.key = key
+        self._local = LocalTokenBucket()
+        self._shared = None
+
+    @property
+    def bucket(self):
+        if not self.redis_url:
+            return self._local
+        if self._shared is None:
+            self._shared = RedisTokenBucket(self.redis_url, self.key)
+        return self._shared
+
+    def _rates(self):
+        max_rate = settings.GROQ_RATE_LIMIT_RPM / 60
+        min_rate = max_rate * MIN_RATE_FRACTION
+        return max_rate, min_rate
+
+    def try_acquire(self):
+        """
+        Take a token if one is available. Returns 0 on success, otherwise the
+        number of seconds to wait before trying again.
+        """
+
+        max_rate, min_rate = self._rates()
+        recovery = (max_rate - min_rate) / settings.GROQ_RATE_LIMIT_RECOVERY_TIME
+        args = (max_rate, min_rate, settings.GROQ_RATE_LIMIT_BURST, recovery)
+        try:
+            return self.bucket.acquire(*args)
+        except redis.RedisError as e:
+            print("Error using the shared rate limiter: ", e)
+            return self._local.acquire(*args)
+
+    def acquire(self):
+        """
+        Block until a token is taken.
+        """
+
+        while (wait := self.try_acquire()) > 0:
+            time.sleep(wait)
+
+    async def run_off_loop(self, func, *args):
+        """
+        Call func from a worker thread when it may talk to Redis, so that the
+        round trip doesn't block the event loop, or directly when the bucket
+        is in process memory.
+        """
+
+        if not self.redis_url:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def aacquire(self):
+        """
+        Async version of acquire, blocking neither on the shared bucket nor
+        while sleeping.
+        """
+
+        while (wait := await self.run_off_loop(self.try_acquire)) > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, retry_after):
+        """
+        Report a 429 response: pause all callers for retry_after seconds and
+        cut the rate.
+        """
+
+        max_rate, min_rate = self._rates()
+        args = (
+            max_rate,
+            min_rate,
+            settings.GROQ_RATE_LIMIT_BACKOFF_FACTOR,
+            retry_after,
+        )
+        try:
+            return self.bucket.penalize(*args)
+        except redis.RedisError as e:
+            print("Error using the shared rate limiter: ", e)
+            return self._local.penalize(*args)
+
+    def get_retry_delay(self, error, attempt):
+        """
+        Handle a failed call and return how long to wait before retrying it.
+        """
+
+        retry_after = get_retry_after(error)
+        if retry_after is None:
+            retry_after = get_backoff(attempt)
+        if isinstance(error, RateLimitError):
+            self.penalize(retry_after)
+            # The bucket is blocked for retry_after, acquire() does the wait.
+            return 0
+        return retry_after
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func once a token is available, retrying rate-limited and
+        transient failures up to GROQ_MAX_RETRIES times.
+        """
+
+        for attempt in range(settings.GROQ_MAX_RETRIES + 1):
+            self.acquire()
+            try:
+                return func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                delay = self.get_retry_delay(e, attempt)
+                if attempt == settings.GROQ_MAX_RETRIES:
+                    raise
+                time.sleep(delay)
+
+    async def acall(self, func, *args, **kwargs):
+        """
+        Async version of call for coroutine functions.
+        """
+
+        for attempt in range(settings.GROQ_MAX_RETRIES + 1):
+            await self.aacquire()
+            try:
+                return await func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                delay = await self.run_off_loop(self.get_retry_delay, e, attempt)
+                if attempt == settings.GROQ_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(delay)
+
+    def reset(self):
+        """
+        Refill the bucket and restore the full rate.
+        """
+
+        self._local.reset()
+        if self.redis_url:
+            self.bucket.reset()
+
+
+rate_limiter = RateLimiter(redis_url=settings.GROQ_RATE_LIMIT_REDIS_URL)
@@ -15,6 +15,7 @@ import os
 from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
+from kombu import Queue
 
 
 load_dotenv()
@@ -54,12 +55,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "posts_ai_api.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "posts_ai_api.db_routing.ReplicaRoutingMiddleware",
+    "posts_ai_api.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "posts_ai_api.urls"
@@ -86,13 +90,100 @@ WSGI_APPLICATION = "posts_ai_api.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+# DATABASE_BACKEND=postgres switches from the SQLite file to Postgres, which
+# needs the psycopg package. Connections are kept open for
+# DATABASE_CONN_MAX_AGE seconds and checked before reuse, or pooled with
+# DATABASE_POOL=True.
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "sqlite")
+
+# SQLITE_HIGH_CONCURRENCY=True lets the web and Celery workers of a single
+# node write to the SQLite file concurrently. In WAL mode readers don't block
+# the writer, synchronous=NORMAL only syncs at checkpoints, and the file is
+# read through a memory map. Write transactions take the write lock when they
+# begin, so that they wait for it up to SQLITE_BUSY_TIMEOUT seconds instead of
+# failing with "database is locked" when upgrading from a read lock.
+SQLITE_HIGH_CONCURRENCY = os.getenv("SQLITE_HIGH_CONCURRENCY") == "True"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 20))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_HIGH_CONCURRENCY_OPTIONS = {
+    "init_command": (
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}"
+    ),
+    "transaction_mode": "IMMEDIATE",
+    "timeout": SQLITE_BUSY_TIMEOUT,
 }
 
+if DATABASE_BACKEND == "postgres":
+    DATABASE_POOL = os.getenv("DATABASE_POOL") == "True"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "posts_ai_api"),
+            "USER": os.getenv("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            # Pooled connections are returned to the pool after each request.
+            "CONN_MAX_AGE": (
+                0 if DATABASE_POOL else int(os.getenv("DATABASE_CONN_MAX_AGE", 60))
+            ),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {"pool": True} if DATABASE_POOL else {},
+        }
+    }
+    if os.getenv("POSTGRES_REPLICA_HOST"):
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "HOST": os.getenv("POSTGRES_REPLICA_HOST"),
+            "PORT": os.getenv("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": (
+                SQLITE_HIGH_CONCURRENCY_OPTIONS if SQLITE_HIGH_CONCURRENCY else {}
+            ),
+        },
+        # A second alias of the same file standing in for a replica, to try
+        # replica routing locally with DATABASE_READ_REPLICAS=replica.
+        "replica": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("SQLITE_REPLICA_NAME", BASE_DIR / "db.sqlite3"),
+            # Reads don't need to take the write lock when they begin.
+            "OPTIONS": (
+                {
+                    name: value
+                    for name, value in SQLITE_HIGH_CONCURRENCY_OPTIONS.items()
+                    if name != "transaction_mode"
+                }
+                if SQLITE_HIGH_CONCURRENCY
+                else {}
+            ),
+            "TEST": {"MIRROR": "default"},
+        },
+    }
+
+DATABASE_ROUTERS = ["posts_ai_api.db_routing.ReplicaRouter"]
+
+# Aliases that safe-method requests to the views reading from replicas are
+# sent to. Defaults to the Postgres replica when there is one.
+DATABASE_READ_REPLICAS = [
+    alias
+    for alias in os.getenv(
+        "DATABASE_READ_REPLICAS",
+        "replica" if os.getenv("POSTGRES_REPLICA_HOST") else "",
+    ).split(",")
+    if alias
+]
+# After a write, the client's reads stay on the primary for this many
+# seconds, longer than the replication lag, so that it reads its writes.
+DATABASE_PRIMARY_PIN_SECONDS = int(os.getenv("DATABASE_PRIMARY_PIN_SECONDS", 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -137,7 +228,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "posts_ai_api.profiling.TimedJWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
@@ -156,12 +247,262 @@ SIMPLE_JWT = {
 }
 
 
+# Responses of at least this many bytes are compressed with brotli, when the
+# brotli package is installed and the client accepts it, or with gzip.
+COMPRESSION_MIN_LENGTH = int(os.getenv("COMPRESSION_MIN_LENGTH", 1024))
+
+# Requests sending an X-Profile header, when PROFILING_HEADER_ENABLED, and a
+# PROFILING_SAMPLE_RATE fraction of all requests get a Server-Timing header and
+# a log line breaking down their time. With PROFILING_DUMP_DIR set, a cProfile
+# dump of each of them is written there.
+PROFILING_HEADER_ENABLED = os.getenv("PROFILING_HEADER_ENABLED", str(DEBUG)) == "True"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_DUMP_DIR = os.getenv("PROFILING_DUMP_DIR")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "posts_ai_api.profiling": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_BROKER_URL")
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {}
+
+# Moderation, which users wait for, and auto-response generation, which is
+# slow, run on separate queues so that a wave of generations doesn't delay
+# moderation. Start one worker pool per queue, see the README. A worker
+# consuming several queues drains them in the order they are given with -Q.
+MODERATION_QUEUE = os.getenv("MODERATION_QUEUE", "moderation")
+RESPONSES_QUEUE = os.getenv("RESPONSES_QUEUE", "responses")
+# Priorities inside a queue, 0 is the highest. Re-enqueued moderation goes
+# behind fresh content.
+MODERATION_PRIORITY = 0
+MODERATION_RETRY_PRIORITY = 6
+RESPONSES_PRIORITY = 3
+
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_TASK_DEFAULT_PRIORITY = 3
+CELERY_TASK_QUEUES = (
+    Queue(MODERATION_QUEUE),
+    Queue(RESPONSES_QUEUE),
+    Queue(CELERY_TASK_DEFAULT_QUEUE),
+)
+CELERY_TASK_ROUTES = {
+    "posts.tasks.moderate_*": {
+        "queue": MODERATION_QUEUE,
+        "priority": MODERATION_PRIORITY,
+    },
+    "posts.tasks.drain_pending_moderation": {"queue": MODERATION_QUEUE},
+    "posts.tasks.sweep_stuck_moderation": {"queue": MODERATION_QUEUE},
+    "posts.tasks.generate_auto_response*": {
+        "queue": RESPONSES_QUEUE,
+        "priority": RESPONSES_PRIORITY,
+    },
+    "posts.tasks.dispatch_auto_responses": {"queue": RESPONSES_QUEUE},
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
+# Workers reserve one task per process at a time, so a long generation never
+# holds moderation tasks hostage and priorities are honored.
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(
+    os.getenv("CELERY_WORKER_PREFETCH_MULTIPLIER", 1)
+)
+
+# When enabled, new posts and comments are not moderated one task per item;
+# a periodic task drains them into micro-batches judged in one AI call each.
+MODERATION_BATCH_ENABLED = os.getenv("MODERATION_BATCH_ENABLED") == "True"
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", 20))
+MODERATION_BATCH_MAX_CHARS = int(os.getenv("MODERATION_BATCH_MAX_CHARS", 12000))
+MODERATION_BATCH_INTERVAL = float(os.getenv("MODERATION_BATCH_INTERVAL", 2))
+MODERATION_BATCH_MAX_DURATION = int(os.getenv("MODERATION_BATCH_MAX_DURATION", 60))
+# Drains lease the items of a batch in the database, so concurrent drains on
+# any number of workers never judge the same item, and a failing batch is only
+# retried once its lease expires.
+MODERATION_BATCH_LEASE = int(os.getenv("MODERATION_BATCH_LEASE", 120))
+
+# Content longer than one chunk is split into overlapping chunks moderated
+# concurrently. The chunks stay well within the 8192-token context of the
+# model, and content needing more than MODERATION_MAX_CHUNKS is blocked.
+MODERATION_CHUNK_MAX_TOKENS = int(os.getenv("MODERATION_CHUNK_MAX_TOKENS", 2000))
+MODERATION_CHUNK_OVERLAP_TOKENS = int(
+    os.getenv("MODERATION_CHUNK_OVERLAP_TOKENS", 50)
+)
+MODERATION_MAX_CHUNKS = int(os.getenv("MODERATION_MAX_CHUNKS", 16))
+
+# Longest content accepted by the API, in characters.
+POST_CONTENT_MAX_LENGTH = int(os.getenv("POST_CONTENT_MAX_LENGTH", 20000))
+COMMENT_CONTENT_MAX_LENGTH = int(os.getenv("COMMENT_CONTENT_MAX_LENGTH", 5000))
+
+# Most posts or comments created by one bulk create request.
+BULK_CREATE_MAX_ITEMS = int(os.getenv("BULK_CREATE_MAX_ITEMS", 1000))
+
+# Port on which Celery workers expose their metrics, for hosts without a web
+# process serving /metrics. Set PROMETHEUS_MULTIPROC_DIR to aggregate the
+# metrics of all processes of a host.
+METRICS_WORKER_PORT = int(os.getenv("METRICS_WORKER_PORT", 0))
+
+# /metrics is only served to METRICS_ALLOWED_IPS, the host itself by default,
+# and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>", since every
+# scrape queries the database and the broker.
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip
+]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Longest wait for the broker when reading the queue depths, in seconds.
+METRICS_BROKER_TIMEOUT = float(os.getenv("METRICS_BROKER_TIMEOUT", 2))
+
+# Lexical pre-filter deciding obvious cases before the AI model. The wordlist
+# files are re-read when they change.
+MODERATION_BLOCKLIST_PATH = os.getenv(
+    "MODERATION_BLOCKLIST_PATH", BASE_DIR / "posts" / "wordlists" / "blocklist.txt"
+)
+MODERATION_ALLOWLIST_PATH = os.getenv(
+    "MODERATION_ALLOWLIST_PATH", BASE_DIR / "posts" / "wordlists" / "allowlist.txt"
+)
+MODERATION_PREFILTER_APPROVE_MAX_LENGTH = int(
+    os.getenv("MODERATION_PREFILTER_APPROVE_MAX_LENGTH", 40)
+)
+MODERATION_PREFILTER_RELOAD_INTERVAL = float(
+    os.getenv("MODERATION_PREFILTER_RELOAD_INTERVAL", 10)
+)
+
+# Local classifier trained on stored AI model verdicts. Content it is
+# confident about, with a probability of at least MODERATION_CLASSIFIER_THRESHOLD,
+# is decided without the AI model, except for an audited fraction.
+MODERATION_CLASSIFIER_PATH = os.getenv(
+    "MODERATION_CLASSIFIER_PATH", BASE_DIR / "moderation_classifier.json"
+)
+MODERATION_CLASSIFIER_THRESHOLD = float(
+    os.getenv("MODERATION_CLASSIFIER_THRESHOLD", 0.97)
+)
+MODERATION_CLASSIFIER_AUDIT_RATE = float(
+    os.getenv("MODERATION_CLASSIFIER_AUDIT_RATE", 0.05)
+)
+MODERATION_CLASSIFIER_RELOAD_INTERVAL = float(
+    os.getenv("MODERATION_CLASSIFIER_RELOAD_INTERVAL", 10)
+)
+
+# Posts and comments pending for longer than MODERATION_STALE_AFTER seconds are
+# re-enqueued by a periodic sweeper, and moved to the failed status after
+# MODERATION_MAX_ATTEMPTS attempts.
+MODERATION_STALE_AFTER = int(os.getenv("MODERATION_STALE_AFTER", 300))
+MODERATION_SWEEP_INTERVAL = float(os.getenv("MODERATION_SWEEP_INTERVAL", 60))
+MODERATION_SWEEP_LIMIT = int(os.getenv("MODERATION_SWEEP_LIMIT", 5000))
+MODERATION_MAX_ATTEMPTS = int(os.getenv("MODERATION_MAX_ATTEMPTS", 5))
+
+# Automatic responses are stored with their due time and dispatched by a
+# periodic task, instead of waiting in workers as countdown tasks.
+AUTO_RESPONSE_DISPATCH_INTERVAL = float(
+    os.getenv("AUTO_RESPONSE_DISPATCH_INTERVAL", 10)
+)
+AUTO_RESPONSE_DISPATCH_BATCH_SIZE = int(
+    os.getenv("AUTO_RESPONSE_DISPATCH_BATCH_SIZE", 20)
+)
+AUTO_RESPONSE_DISPATCH_LIMIT = int(os.getenv("AUTO_RESPONSE_DISPATCH_LIMIT", 1000))
+# Dispatched responses not generated within the lease are dispatched again.
+AUTO_RESPONSE_LEASE = int(os.getenv("AUTO_RESPONSE_LEASE", 600))
+
+CELERY_BEAT_SCHEDULE["dispatch-auto-responses"] = {
+    "task": "posts.tasks.dispatch_auto_responses",
+    "schedule": AUTO_RESPONSE_DISPATCH_INTERVAL,
+}
+CELERY_BEAT_SCHEDULE["sweep-stuck-moderation"] = {
+    "task": "posts.tasks.sweep_stuck_moderation",
+    "schedule": MODERATION_SWEEP_INTERVAL,
+}
+
+if MODERATION_BATCH_ENABLED:
+    CELERY_BEAT_SCHEDULE["drain-pending-moderation"] = {
+        "task": "posts.tasks.drain_pending_moderation",
+        "schedule": MODERATION_BATCH_INTERVAL,
+    }
 
 AUTH_USER_MODEL = "registration.CustomUser"
 
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+MODERATION_CACHE_REDIS_URL = os.getenv("MODERATION_CACHE_REDIS_URL")
+MODERATION_CACHE_TTL = int(os.getenv("MODERATION_CACHE_TTL", 60 * 60 * 24 * 7))
+MODERATION_CACHE_MAX_ENTRIES = int(os.getenv("MODERATION_CACHE_MAX_ENTRIES", 100000))
+MODERATION_CACHE_LOCAL_SIZE = int(os.getenv("MODERATION_CACHE_LOCAL_SIZE", 10000))
+
+if MODERATION_CACHE_REDIS_URL:
+    # Size is bounded by the Redis maxmemory policy, e.g. volatile-lru.
+    MODERATION_CACHE = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": MODERATION_CACHE_REDIS_URL,
+        "TIMEOUT": MODERATION_CACHE_TTL,
+    }
+else:
+    MODERATION_CACHE = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "moderation",
+        "TIMEOUT": MODERATION_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": MODERATION_CACHE_MAX_ENTRIES},
+    }
+
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+if CACHE_REDIS_URL:
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CACHE_REDIS_URL,
+    }
+else:
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "default",
+    }
+
+CACHES = {
+    "default": DEFAULT_CACHE,
+    "moderation": MODERATION_CACHE,
+}
+
+# API responses are only cached with a shared default cache. With the
+# per-process local-memory cache, the invalidations made by Celery workers and
+# other web processes would never reach the process serving a response.
+RESPONSE_CACHE_ENABLED = (
+    os.getenv("RESPONSE_CACHE_ENABLED", str(bool(CACHE_REDIS_URL))) == "True"
+)
+# Upper bound on how long a cached API response may be served after a change
+# that was not invalidated explicitly.
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 300))
+
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 30))
+GROQ_MODERATION_TIMEOUT = float(os.getenv("GROQ_MODERATION_TIMEOUT", 15))
+GROQ_GENERATION_TIMEOUT = float(os.getenv("GROQ_GENERATION_TIMEOUT", 60))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", 64))
+GROQ_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", 32))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", 60))
+# Maximum number of concurrent GROQ API calls from one async fan-out.
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", 32))
+# Retries of rate-limited and transient failures, done by the rate limiter
+# rather than the GROQ client so that every retry takes a token.
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 2))
+GROQ_RETRY_BACKOFF = float(os.getenv("GROQ_RETRY_BACKOFF", 0.5))
+GROQ_RETRY_BACKOFF_MAX = float(os.getenv("GROQ_RETRY_BACKOFF_MAX", 8))
+
+# Token bucket shared by all workers through Redis, or kept in process memory
+# when no Redis URL is set. The rate is cut on 429 responses and recovers
+# linearly over GROQ_RATE_LIMIT_RECOVERY_TIME seconds.
+GROQ_RATE_LIMIT_REDIS_URL = os.getenv("GROQ_RATE_LIMIT_REDIS_URL")
+GROQ_RATE_LIMIT_RPM = float(os.getenv("GROQ_RATE_LIMIT_RPM", 30))
+GROQ_RATE_LIMIT_BURST = float(os.getenv("GROQ_RATE_LIMIT_BURST", 10))
+GROQ_RATE_LIMIT_BACKOFF_FACTOR = float(os.getenv("GROQ_RATE_LIMIT_BACKOFF_FACTOR", 0.5))
+GROQ_RATE_LIMIT_RECOVERY_TIME = float(os.getenv("GROQ_RATE_LIMIT_RECOVERY_TIME", 60))
+# Celery retries of a moderation or response task that stayed rate-limited.
+GROQ_RATE_LIMIT_TASK_RETRIES = int(os.getenv("GROQ_RATE_LIMIT_TASK_RETRIES", 5))
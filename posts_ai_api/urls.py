@@ -19,6 +19,8 @@ from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView
 
+from posts.views import metrics_view
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -30,4 +32,5 @@ urlpatterns = [
     ),
     path("api/", include("registration.urls")),
     path("api/", include("posts.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]